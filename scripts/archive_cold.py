@@ -0,0 +1,247 @@
+"""Move closed months older than the retention window out of the hot tables.
+
+Opt-in: the stage does nothing unless ARCHIVE_DIR is set, and it must point at
+durable storage the API also reads (a mounted volume or synced bucket, not a
+CI runner's disk), since the archived rows exist nowhere else. Then every month before the cutoff (the first day of the current month minus
+ARCHIVE_RETENTION_MONTHS) that still has rows in public.order_lines or
+public.returns is archived:
+  1) its order lines and returns (returns follow their order's month) are
+     merged into the month's Parquet files under ARCHIVE_DIR, written to a
+     temp file and renamed into place,
+  2) in one transaction, the month's daily rollups are replaced, its
+     customers' customer_stats fingerprints are invalidated, its rows are
+     deleted from the hot tables and public.archive_months records it.
+If step 2 fails the rows are still in Postgres and the next run archives them
+again; merging drops rows already in the file, so reruns are safe. The loaders
+skip rows the archive already holds, so a nightly full reload does not bring
+archived months back; late rows for archived months (new or edited lines and
+refunds) land in the hot tables and the next run merges them into their month,
+replacing the archived copy.
+
+The file layout, rollups and the way the API reads them are in src/api/archive.py.
+"""
+import os
+import sys
+import argparse
+from datetime import date
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import text
+
+from db import make_engine
+import profile_cli
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src" / "api"))
+import archive  # noqa: E402
+import build_customer_stats as customer_stats  # noqa: E402
+
+ARCHIVE_RETENTION_MONTHS = int(os.getenv("ARCHIVE_RETENTION_MONTHS", "12"))
+
+SCHEMA = "public"
+
+# Keys that identify a row when merging into an existing month file.
+KEYS = {
+    "order_lines": ["order_line_id"],
+    "returns": ["order_line_id", "refund_timestamp"],
+}
+
+DDL = f"""
+CREATE TABLE IF NOT EXISTS {SCHEMA}.{archive.MANIFEST_TABLE} (
+  month        DATE PRIMARY KEY,
+  order_lines  BIGINT NOT NULL,
+  returns      BIGINT NOT NULL,
+  bytes        BIGINT NOT NULL,
+  archived_at  TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+-- Refund totals as in the /kpis LEFT JOIN; revenue and orders as in /revenue/by-day.
+CREATE TABLE IF NOT EXISTS {SCHEMA}.{archive.DAILY_TABLE} (
+  day            DATE PRIMARY KEY,
+  order_lines    BIGINT NOT NULL,
+  refunded_lines BIGINT NOT NULL,
+  revenue_net    NUMERIC(14, 2) NOT NULL,
+  refunds_total  NUMERIC(14, 2) NOT NULL,
+  orders         BIGINT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS {SCHEMA}.{archive.PRODUCT_TABLE} (
+  day          DATE NOT NULL,
+  product_id   INT NOT NULL,
+  units_sold   BIGINT NOT NULL,
+  revenue_net  NUMERIC(14, 2) NOT NULL,
+  PRIMARY KEY (day, product_id)
+);
+"""
+
+# customer_stats fingerprints the hot tables only, so a late row that arrives
+# and is moved out here between two refreshes leaves no trace. Mark the
+# fingerprints of every customer with rows in the month as unknown (NaN never
+# equals a hash sum) so the next refresh recomputes them from the archive.
+STALE_SQL = f"""
+UPDATE {customer_stats.SCHEMA}.{customer_stats.STATE_TABLE}
+SET lines_hash = 'NaN'
+WHERE customer_id IN (
+  SELECT customer_id FROM {SCHEMA}.order_lines WHERE order_timestamp >= :start AND order_timestamp < :end
+  UNION
+  SELECT customer_id FROM {SCHEMA}.returns WHERE order_timestamp >= :start AND order_timestamp < :end
+)
+"""
+
+MONTHS_SQL = f"""
+SELECT DISTINCT date_trunc('month', order_timestamp)::date AS month
+FROM (
+  SELECT order_timestamp FROM {SCHEMA}.order_lines WHERE order_timestamp < :cutoff
+  UNION ALL
+  SELECT order_timestamp FROM {SCHEMA}.returns WHERE order_timestamp < :cutoff
+) t
+ORDER BY 1
+"""
+
+
+def cutoff(today: date = None, retention_months: int = None) -> date:
+    """First day of the oldest month kept hot; months before it are archived."""
+    today = today or date.today()
+    retention = ARCHIVE_RETENTION_MONTHS if retention_months is None else retention_months
+    if retention < 1:
+        raise ValueError("ARCHIVE_RETENTION_MONTHS must be at least 1 (only closed months are archived)")
+    index = today.year * 12 + today.month - 1 - retention
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _merge(table: str, month: date, hot: pd.DataFrame) -> pd.DataFrame:
+    path = archive.month_path(table, month)
+    if not os.path.exists(path):
+        return hot
+    old = pq.read_table(path).to_pandas()
+    merged = pd.concat([old, hot], ignore_index=True) if len(hot) else old
+    return merged.drop_duplicates(KEYS[table], keep="last")
+
+
+def _write(table: str, month: date, df: pd.DataFrame) -> int:
+    path = archive.month_path(table, month)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    df = df.sort_values(["order_timestamp", KEYS[table][0]])
+    pq.write_table(
+        pa.Table.from_pandas(df, schema=archive.arrow_schema(table), preserve_index=False),
+        path + ".tmp",
+        compression="zstd",
+    )
+    os.replace(path + ".tmp", path)
+    return os.path.getsize(path)
+
+
+def _rollups(lines: pd.DataFrame, returns: pd.DataFrame):
+    """Per-day and per-day×product totals for one archived month."""
+    lines = lines.assign(day=lines["order_timestamp"].dt.date)
+    joined = lines.merge(returns[["order_line_id", "refund_amount"]], on="order_line_id", how="left")
+
+    daily = lines.groupby("day").agg(
+        order_lines=("order_line_id", "size"),
+        revenue_net=("net_revenue", "sum"),
+        orders=("order_id", "nunique"),
+    ).join(joined.groupby("day").agg(
+        refunded_lines=("refund_amount", "count"),
+        refunds_total=("refund_amount", "sum"),
+    )).reset_index()
+
+    by_product = lines.groupby(["day", "product_id"]).agg(
+        units_sold=("qty", "sum"),
+        revenue_net=("net_revenue", "sum"),
+    ).reset_index()
+    return daily, by_product
+
+
+def archive_month(engine, month: date) -> tuple:
+    end = archive.next_month(month)
+    frames, sizes = {}, 0
+    for table, columns in archive.COLUMNS.items():
+        hot = pd.read_sql(
+            text(f"""
+                SELECT {", ".join(columns)} FROM {SCHEMA}.{table}
+                WHERE order_timestamp >= :start AND order_timestamp < :end
+            """),
+            engine, params={"start": month, "end": end}, coerce_float=False,
+        )
+        frames[table] = _merge(table, month, hot)
+        sizes += _write(table, month, frames[table])
+
+    daily, by_product = _rollups(frames["order_lines"], frames["returns"])
+    bounds = {"start": month, "end": end}
+
+    with engine.begin() as conn:
+        conn.execute(text(f"DELETE FROM {SCHEMA}.{archive.DAILY_TABLE} WHERE day >= :start AND day < :end"), bounds)
+        conn.execute(text(f"DELETE FROM {SCHEMA}.{archive.PRODUCT_TABLE} WHERE day >= :start AND day < :end"), bounds)
+        if len(daily):
+            conn.execute(
+                text(f"""
+                    INSERT INTO {SCHEMA}.{archive.DAILY_TABLE}
+                    (day, order_lines, refunded_lines, revenue_net, refunds_total, orders)
+                    VALUES (:day, :order_lines, :refunded_lines, :revenue_net, :refunds_total, :orders)
+                """),
+                daily.to_dict("records"),
+            )
+        if len(by_product):
+            conn.execute(
+                text(f"""
+                    INSERT INTO {SCHEMA}.{archive.PRODUCT_TABLE} (day, product_id, units_sold, revenue_net)
+                    VALUES (:day, :product_id, :units_sold, :revenue_net)
+                """),
+                by_product.to_dict("records"),
+            )
+        if conn.execute(text(f"SELECT to_regclass('{customer_stats.SCHEMA}.{customer_stats.STATE_TABLE}')")).scalar():
+            conn.execute(text(STALE_SQL), bounds)
+        for table in ("returns", "order_lines"):
+            conn.execute(
+                text(f"DELETE FROM {SCHEMA}.{table} WHERE order_timestamp >= :start AND order_timestamp < :end"),
+                bounds,
+            )
+        conn.execute(text(f"""
+            INSERT INTO {SCHEMA}.{archive.MANIFEST_TABLE} (month, order_lines, returns, bytes, archived_at)
+            VALUES (:month, :lines, :returns, :bytes, now())
+            ON CONFLICT (month) DO UPDATE SET
+              order_lines = EXCLUDED.order_lines, returns = EXCLUDED.returns,
+              bytes = EXCLUDED.bytes, archived_at = now()
+        """), {"month": month, "lines": len(frames["order_lines"]), "returns": len(frames["returns"]),
+               "bytes": sizes})
+
+    return len(frames["order_lines"]), len(frames["returns"]), sizes
+
+
+def load(engine, retention_months: int = None) -> int:
+    if not archive.ARCHIVE_DIR:
+        print("SKIP: ARCHIVE_DIR is not set, archiving is off")
+        return 0
+    cut = cutoff(retention_months=retention_months)
+    with engine.begin() as conn:
+        conn.execute(text(DDL))
+        months = conn.execute(text(MONTHS_SQL), {"cutoff": cut}).scalars().all()
+
+    moved = 0
+    for month in months:
+        lines, returns, size = archive_month(engine, month)
+        moved += lines
+        print(f"🧊 Archived {month:%Y-%m}: {lines} order lines, {returns} returns ({size / 1e6:.2f} MB parquet)")
+
+    if months:
+        # Fresh planner stats and reusable space for the rows just moved out.
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text(f"VACUUM (ANALYZE) {SCHEMA}.order_lines, {SCHEMA}.returns"))
+
+    print(f"✅ Archived {len(months)} months before {cut} to {archive.ARCHIVE_DIR}")
+    return moved
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive closed months to Parquet.")
+    parser.add_argument(
+        "--retention-months", type=int, default=None,
+        help=f"Closed months kept in Postgres before the current one (default ARCHIVE_RETENTION_MONTHS={ARCHIVE_RETENTION_MONTHS}).",
+    )
+    profile_cli.add_argument(parser)
+    args = parser.parse_args()
+    profile_cli.run("archive_cold", args.profile, vars(args), load, make_engine(),
+                    retention_months=args.retention_months)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+import sys
+import argparse
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.compute as pc
+from sqlalchemy import text
+
+from db import make_engine
+import profile_cli
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src" / "api"))
+import archive  # noqa: E402
+
+SCHEMA = "public"
+TABLE = "customer_stats"
+STATE_TABLE = "customer_stats_inputs"
+
+DDL = f"""
+CREATE TABLE IF NOT EXISTS {SCHEMA}.{TABLE} (
+  customer_id     BIGINT PRIMARY KEY,
+  orders          BIGINT NOT NULL,
+  order_lines     BIGINT NOT NULL,
+  revenue_net     NUMERIC(14, 2) NOT NULL,
+  refunds_total   NUMERIC(14, 2) NOT NULL,
+  lifetime_value  NUMERIC(14, 2) NOT NULL,
+  first_order_at  TIMESTAMP,
+  last_order_at   TIMESTAMP,
+  updated_at      TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS customer_stats_ltv_idx ON {SCHEMA}.{TABLE} (lifetime_value DESC);
+
+-- Fingerprints of each customer's hot order lines and refunds as of the last
+-- refresh. They replace the old id/timestamp watermarks, which missed edited
+-- lines and refunds that arrived late with an earlier refund_timestamp.
+DROP TABLE IF EXISTS {SCHEMA}.customer_stats_state;
+CREATE TABLE IF NOT EXISTS {SCHEMA}.{STATE_TABLE} (
+  customer_id    BIGINT PRIMARY KEY,
+  lines_hash     NUMERIC NOT NULL,
+  refunds_hash   NUMERIC NOT NULL
+);
+
+-- Recomputing one customer must not scan the whole history.
+CREATE INDEX IF NOT EXISTS order_lines_customer_idx ON {SCHEMA}.order_lines (customer_id);
+CREATE INDEX IF NOT EXISTS returns_customer_idx ON {SCHEMA}.returns (customer_id);
+"""
+
+# Per customer, the sum of a 64-bit hash of every hot order line and refund.
+# Any insert, edit or delete (including rows moved out by archive_cold)
+# changes the customer's sums, whatever their ids and timestamps.
+# archive_cold also sets lines_hash to NaN for the customers of each month it
+# moves, so late rows that reach the archive between two refreshes count too.
+INPUTS_SQL = f"""
+CREATE TEMP TABLE current_inputs ON COMMIT DROP AS
+SELECT customer_id, SUM(lines_hash) AS lines_hash, SUM(refunds_hash) AS refunds_hash
+FROM (
+  SELECT customer_id,
+         hashtextextended(concat_ws('|', order_line_id, order_id, order_timestamp, net_revenue), 0)::numeric AS lines_hash,
+         0::numeric AS refunds_hash
+  FROM {SCHEMA}.order_lines
+  UNION ALL
+  SELECT customer_id,
+         0::numeric,
+         hashtextextended(concat_ws('|', order_line_id, refund_timestamp, refund_amount), 0)::numeric
+  FROM {SCHEMA}.returns
+) rows
+GROUP BY customer_id;
+"""
+
+# Customers whose fingerprints differ from the stored ones (or appear in only one).
+TOUCHED_SQL = f"""
+CREATE TEMP TABLE touched_customers ON COMMIT DROP AS
+SELECT customer_id
+FROM current_inputs c
+FULL JOIN {SCHEMA}.{STATE_TABLE} s USING (customer_id)
+WHERE c.lines_hash IS DISTINCT FROM s.lines_hash
+   OR c.refunds_hash IS DISTINCT FROM s.refunds_hash;
+"""
+
+# {archived}: per-order totals of archived lines (see archived_orders()), so
+# history is never lost.
+TOUCHED_ALL_SQL = """
+CREATE TEMP TABLE touched_customers ON COMMIT DROP AS
+SELECT customer_id FROM current_inputs
+UNION
+SELECT customer_id FROM {archived};
+"""
+
+REBUILD_SQL = f"""
+DELETE FROM {SCHEMA}.{TABLE} s
+USING touched_customers t
+WHERE s.customer_id = t.customer_id;
+
+INSERT INTO {SCHEMA}.{TABLE} (
+  customer_id, orders, order_lines, revenue_net, refunds_total,
+  lifetime_value, first_order_at, last_order_at
+)
+SELECT
+  o.customer_id,
+  COUNT(DISTINCT o.order_id),
+  SUM(o.order_lines),
+  COALESCE(SUM(o.revenue_net), 0),
+  COALESCE(SUM(o.refunds_total), 0),
+  COALESCE(SUM(o.revenue_net), 0) - COALESCE(SUM(o.refunds_total), 0),
+  MIN(o.first_order_at),
+  MAX(o.last_order_at)
+FROM (
+  SELECT
+    ol.customer_id,
+    ol.order_id,
+    COUNT(*) AS order_lines,
+    SUM(ol.net_revenue) AS revenue_net,
+    SUM(r.refund_amount) AS refunds_total,
+    MIN(ol.order_timestamp) AS first_order_at,
+    MAX(ol.order_timestamp) AS last_order_at
+  FROM {{lines}} ol
+  JOIN touched_customers t ON t.customer_id = ol.customer_id
+  LEFT JOIN (
+    SELECT r.order_line_id, SUM(r.refund_amount) AS refund_amount
+    FROM {{returns}} r
+    JOIN touched_customers t ON t.customer_id = r.customer_id
+    GROUP BY 1
+  ) r ON r.order_line_id = ol.order_line_id
+  GROUP BY 1, 2
+  -- An order's lines can sit on both sides of the archive boundary, so
+  -- orders are counted after the union.
+  UNION ALL
+  SELECT a.customer_id, a.order_id, a.order_lines, a.revenue_net, a.refunds_total, a.first_order_at, a.last_order_at
+  FROM {{archived}} a
+  JOIN touched_customers t ON t.customer_id = a.customer_id
+) o
+GROUP BY o.customer_id;
+"""
+
+SAVE_STATE_SQL = f"""
+DELETE FROM {SCHEMA}.{STATE_TABLE} s
+USING touched_customers t
+WHERE s.customer_id = t.customer_id;
+
+INSERT INTO {SCHEMA}.{STATE_TABLE} (customer_id, lines_hash, refunds_hash)
+SELECT c.customer_id, c.lines_hash, c.refunds_hash
+FROM current_inputs c
+JOIN touched_customers t ON t.customer_id = c.customer_id;
+"""
+
+def archived_orders(conn, boundary, where=None) -> pa.Table:
+    """Per (customer, order) totals of archived lines and their refunds, as REBUILD_SQL's hot side."""
+    lines = archive.scan(conn, "order_lines", ["customer_id", "order_id", "order_line_id", "net_revenue", "order_timestamp"],
+                         boundary, where=where)
+    returns = archive.scan(conn, "returns", ["customer_id", "order_line_id", "refund_amount"], boundary, where=where)
+    lines = lines.join(archive.refunds_by_line(returns.select(["order_line_id", "refund_amount"])),
+                       "order_line_id", join_type="left outer")
+    out = lines.group_by(["customer_id", "order_id"]).aggregate([
+        ("order_line_id", "count"), ("net_revenue", "sum"), ("refund_amount", "sum"),
+        ("order_timestamp", "min"), ("order_timestamp", "max"),
+    ])
+    return out.rename_columns({
+        "order_line_id_count": "order_lines", "net_revenue_sum": "revenue_net", "refund_amount_sum": "refunds_total",
+        "order_timestamp_min": "first_order_at", "order_timestamp_max": "last_order_at",
+    })
+
+def load(engine, full: bool = False) -> int:
+    """Refresh customer_stats for customers whose order lines or refunds changed.
+
+    Changes are found by comparing per-customer fingerprints of the hot
+    tables with the last run's, which costs one aggregate scan of the hot
+    tables (archived months are closed and never rescanned). full=True
+    recomputes every customer.
+    """
+    with engine.begin() as conn:
+        conn.execute(text(DDL))
+        conn.execute(text(INPUTS_SQL))
+
+        stored = conn.execute(text(f"SELECT EXISTS (SELECT 1 FROM {SCHEMA}.{STATE_TABLE})")).scalar()
+        full = full or not stored
+
+        boundary = archive.boundary(conn)
+        where = None
+        if not full:
+            conn.execute(text(TOUCHED_SQL))
+            if archive.reaches(boundary, None):
+                ids = conn.execute(text("SELECT customer_id FROM touched_customers")).scalars().all()
+                where = pc.field("customer_id").isin(ids)
+        archived = archive.stage(conn, "archived_orders", archived_orders(conn, boundary, where))
+        if full:
+            conn.execute(text(f"TRUNCATE TABLE {SCHEMA}.{TABLE}, {SCHEMA}.{STATE_TABLE};"))
+            conn.execute(text(TOUCHED_ALL_SQL.format(archived=archived)))
+
+        touched = conn.execute(text("SELECT COUNT(*) FROM touched_customers")).scalar_one()
+        params = {}
+        lines = archive.hot("order_lines", params, boundary)
+        returns = archive.hot("returns", params, boundary)
+        conn.execute(text(REBUILD_SQL.format(lines=lines, returns=returns, archived=archived)), params)
+        conn.execute(text(SAVE_STATE_SQL))
+
+    mode = "full rebuild" if full else "incremental"
+    print(f"✅ Refreshed {touched} customers in {SCHEMA}.{TABLE} ({mode})")
+    return touched
+
+def main():
+    parser = argparse.ArgumentParser(description="Refresh per-customer aggregates.")
+    parser.add_argument("--full", action="store_true", help="Recompute every customer.")
+    profile_cli.add_argument(parser)
+    args = parser.parse_args()
+    profile_cli.run("build_customer_stats", args.profile, vars(args), load, make_engine(), full=args.full)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import argparse
+import sys
+from pathlib import Path
+
+import pandas as pd
+from sqlalchemy import text
+
+from db import make_engine
+import profile_cli
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src" / "api"))
+import hll  # noqa: E402
+import archive  # noqa: E402
+
+SCHEMA = "public"
+DAILY_TABLE = "sketch_daily"
+CATEGORY_TABLE = "sketch_daily_category"
+
+DDL = f"""
+CREATE TABLE IF NOT EXISTS {SCHEMA}.{DAILY_TABLE} (
+  day            DATE PRIMARY KEY,
+  order_lines    BIGINT NOT NULL,
+  refunded_lines BIGINT NOT NULL,
+  revenue_net    NUMERIC(14, 2) NOT NULL,
+  refunds_total  NUMERIC(14, 2) NOT NULL,
+  orders_hll     BYTEA NOT NULL,
+  customers_hll  BYTEA NOT NULL
+);
+CREATE TABLE IF NOT EXISTS {SCHEMA}.{CATEGORY_TABLE} (
+  day            DATE NOT NULL,
+  category       TEXT NOT NULL,
+  revenue_net    NUMERIC(14, 2) NOT NULL,
+  orders_hll     BYTEA NOT NULL,
+  customers_hll  BYTEA NOT NULL,
+  PRIMARY KEY (day, category)
+);
+"""
+
+LINES_SQL = f"""
+SELECT
+  ol.order_timestamp::date AS day,
+  p.category,
+  ol.order_id,
+  ol.customer_id
+FROM {SCHEMA}.order_lines ol
+LEFT JOIN {SCHEMA}.products p ON p.product_id = ol.product_id
+"""
+
+# Same LEFT JOIN shape as /kpis, so the additive totals line up exactly.
+DAILY_TOTALS_SQL = f"""
+SELECT
+  ol.order_timestamp::date AS day,
+  COUNT(ol.order_line_id) AS order_lines,
+  COUNT(r.order_line_id) AS refunded_lines,
+  COALESCE(SUM(ol.net_revenue), 0) AS revenue_net,
+  COALESCE(SUM(r.refund_amount), 0) AS refunds_total
+FROM {SCHEMA}.order_lines ol
+LEFT JOIN {SCHEMA}.returns r ON r.order_line_id = ol.order_line_id
+GROUP BY 1
+"""
+
+CATEGORY_TOTALS_SQL = f"""
+SELECT
+  ol.order_timestamp::date AS day,
+  p.category,
+  COALESCE(SUM(ol.net_revenue), 0) AS revenue_net
+FROM {SCHEMA}.order_lines ol
+JOIN {SCHEMA}.products p ON p.product_id = ol.product_id
+WHERE p.category IS NOT NULL
+GROUP BY 1, 2
+"""
+
+def _sketch_rows(df: pd.DataFrame, keys: list) -> pd.DataFrame:
+    """One row per key group with serialized order and customer sketches."""
+    groups = df.groupby(keys, sort=False).ngroup().to_numpy()
+    n = int(groups.max()) + 1 if len(groups) else 0
+    orders = hll.build(groups, df["order_id"].to_numpy(), n)
+    customers = hll.build(groups, df["customer_id"].to_numpy(), n)
+
+    out = df[keys].assign(_g=groups).drop_duplicates("_g").sort_values("_g")
+    out["orders_hll"] = [orders[i].tobytes() for i in out["_g"]]
+    out["customers_hll"] = [customers[i].tobytes() for i in out["_g"]]
+    return out.drop(columns="_g")
+
+def load(engine) -> int:
+    lines = pd.read_sql(text(LINES_SQL), engine)
+    daily_totals = pd.read_sql(text(DAILY_TOTALS_SQL), engine)
+    category_totals = pd.read_sql(text(CATEGORY_TOTALS_SQL), engine)
+
+    # Days in archived months are closed: keep the sketches built before they
+    # were archived and rebuild only the hot days.
+    with engine.begin() as conn:
+        boundary = archive.boundary(conn)
+    if boundary is not None:
+        lines = lines[lines["day"] >= boundary]
+        daily_totals = daily_totals[daily_totals["day"] >= boundary]
+        category_totals = category_totals[category_totals["day"] >= boundary]
+
+    daily = daily_totals.merge(_sketch_rows(lines, ["day"]), on="day")
+    by_category = category_totals.merge(
+        _sketch_rows(lines[lines["category"].notna()], ["day", "category"]), on=["day", "category"]
+    )
+
+    with engine.begin() as conn:
+        conn.execute(text(DDL))
+        if boundary is None:
+            conn.execute(text(f"TRUNCATE TABLE {SCHEMA}.{DAILY_TABLE}, {SCHEMA}.{CATEGORY_TABLE};"))
+        else:
+            for table in (DAILY_TABLE, CATEGORY_TABLE):
+                conn.execute(text(f"DELETE FROM {SCHEMA}.{table} WHERE day >= :b"), {"b": boundary})
+        if len(daily):
+            conn.execute(
+                text(f"""
+                    INSERT INTO {SCHEMA}.{DAILY_TABLE}
+                    (day, order_lines, refunded_lines, revenue_net, refunds_total, orders_hll, customers_hll)
+                    VALUES (:day, :order_lines, :refunded_lines, :revenue_net, :refunds_total, :orders_hll, :customers_hll)
+                """),
+                daily.to_dict("records"),
+            )
+        if len(by_category):
+            conn.execute(
+                text(f"""
+                    INSERT INTO {SCHEMA}.{CATEGORY_TABLE}
+                    (day, category, revenue_net, orders_hll, customers_hll)
+                    VALUES (:day, :category, :revenue_net, :orders_hll, :customers_hll)
+                """),
+                by_category.to_dict("records"),
+            )
+
+    print(f"✅ Built sketches for {len(daily)} days and {len(by_category)} day×category cells")
+    return len(daily)
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the per-day sketch tables.")
+    profile_cli.add_argument(parser)
+    args = parser.parse_args()
+    profile_cli.run("build_sketches", args.profile, vars(args), load, make_engine())
+
+if __name__ == "__main__":
+    main()
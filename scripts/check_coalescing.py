@@ -0,0 +1,49 @@
+"""Fire N identical /kpis requests at once and check they share one DB query.
+
+Runs the Flask app in-process against the configured database:
+    python scripts/check_coalescing.py
+"""
+import sys
+import time
+import threading
+from pathlib import Path
+
+from sqlalchemy import event
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src" / "api"))
+import app as api  # noqa: E402
+
+N_REQUESTS = 20
+PARAMS = "start=2025-06-21&end=2025-12-17"
+
+def main():
+    executed = []
+
+    @event.listens_for(api.engine, "before_cursor_execute")
+    def count_kpis(conn, cursor, statement, parameters, context, executemany):
+        if "WITH base AS" in statement:
+            executed.append(statement)
+            # Hold the query open long enough for every request to arrive.
+            time.sleep(0.5)
+
+    client = api.app.test_client()
+    statuses = []
+    barrier = threading.Barrier(N_REQUESTS)
+
+    def hit():
+        barrier.wait()
+        statuses.append(client.get(f"/kpis?{PARAMS}").status_code)
+
+    threads = [threading.Thread(target=hit) for _ in range(N_REQUESTS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    print(f"requests: {len(statuses)}, statuses: {sorted(set(statuses))}, kpis queries: {len(executed)}")
+    if statuses != [200] * N_REQUESTS or len(executed) != 1:
+        raise SystemExit("❌ Concurrent identical requests were not coalesced into one query.")
+    print("✅ Concurrent identical requests shared one query.")
+
+if __name__ == "__main__":
+    main()
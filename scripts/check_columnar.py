@@ -0,0 +1,59 @@
+"""Check the in-memory analytics engine returns the same JSON as the SQL path.
+
+Runs the Flask app in-process against the configured database:
+    python scripts/check_columnar.py
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src" / "api"))
+import app as api  # noqa: E402
+from columnar import ColumnarStore, Snapshot  # noqa: E402
+
+RANGES = [
+    ("2025-06-21", "2025-12-17"),
+    ("2025-09-01", "2025-09-30"),
+    ("2025-10-05", "2025-10-05"),
+    ("2030-01-01", "2030-01-31"),
+]
+
+ENDPOINTS = [
+    "/kpis?start={start}&end={end}",
+    "/revenue/by-day?start={start}&end={end}",
+    "/revenue/by-day?start={start}&end={end}&granularity=hour",
+    "/revenue/by-day?start={start}&end={end}&granularity=week",
+    "/revenue/by-day?start={start}&end={end}&max_points=10",
+    "/revenue/by-category?start={start}&end={end}",
+    "/top-products?start={start}&end={end}&limit=25",
+    "/marketing/roas-by-day?start={start}&end={end}",
+    "/marketing/roas-by-day?start={start}&end={end}&granularity=month",
+]
+
+def fetch_all(client):
+    out = {}
+    for start, end in RANGES:
+        for e in ENDPOINTS:
+            url = e.format(start=start, end=end)
+            out[url] = client.get(url).get_json()
+    return out
+
+def main():
+    client = api.app.test_client()
+
+    api.columnar = None
+    sql_results = fetch_all(client)
+
+    api.columnar = ColumnarStore(api.router.engine_for)
+    api.columnar.snapshot = Snapshot.load(api.engine)
+    memory_results = fetch_all(client)
+
+    failures = [url for url in sql_results if sql_results[url] != memory_results[url]]
+    for url in sql_results:
+        print(f"{url}: {'FAIL' if url in failures else 'OK'}")
+
+    if failures:
+        raise SystemExit(f"❌ In-memory results differ from SQL: {failures}")
+    print("✅ In-memory engine matches the SQL path.")
+
+if __name__ == "__main__":
+    main()
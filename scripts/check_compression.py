@@ -0,0 +1,70 @@
+"""Check that compressed API responses decode to the uncompressed body.
+
+Usage: python scripts/check_compression.py [START END]
+
+Calls each endpoint with every supported Accept-Encoding through the Flask
+test client and prints the body size per encoding, then checks that a
+repeated coalesced request reuses the memoized compressed body.
+"""
+import sys
+import zlib
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src" / "api"))
+import app as api  # noqa: E402
+import compression  # noqa: E402
+
+def decode(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return compression.brotli.decompress(body)
+    if encoding == "zstd":
+        return compression.zstandard.ZstdDecompressor().decompressobj().decompress(body)
+    return zlib.decompress(body, 31)
+
+def main():
+    start, end = sys.argv[1:3] if len(sys.argv) >= 3 else ("2025-01-01", "2025-12-31")
+    urls = [
+        f"/kpis?start={start}&end={end}",
+        f"/revenue/by-day?start={start}&end={end}",
+        f"/top-products?start={start}&end={end}&limit=200",
+        f"/marketing/roas-by-day?start={start}&end={end}",
+        f"/export/order-lines?start={start}&end={end}&limit=5000",
+        "/health",
+    ]
+    client = api.app.test_client()
+    failures = []
+    for url in urls:
+        plain = client.get(url, headers={"Accept-Encoding": "identity"}).get_data()
+        sizes = [f"identity={len(plain)}"]
+        for encoding in compression.ENCODINGS:
+            resp = client.get(url, headers={"Accept-Encoding": encoding})
+            body = resp.get_data()
+            used = resp.headers.get("Content-Encoding")
+            if used is None:
+                ok = body == plain and len(plain) < compression.COMPRESS_MIN_SIZE
+            else:
+                ok = used == encoding and decode(body, encoding) == plain
+            sizes.append(f"{encoding}={len(body) if used else '-'}")
+            if not ok:
+                failures.append((url, encoding))
+        print(f"{'OK' if not any(f[0] == url for f in failures) else 'FAIL'}  {url}: {', '.join(sizes)}")
+
+    # A repeat of a coalesced request must not compress its body again
+    calls = []
+    real = compression.compress
+    compression.compress = lambda data, encoding: calls.append(encoding) or real(data, encoding)
+    try:
+        for encoding in compression.ENCODINGS:
+            client.get(urls[0], headers={"Accept-Encoding": encoding})
+    finally:
+        compression.compress = real
+    print(f"repeat compressions: {len(calls)}")
+    if calls:
+        failures.append((urls[0], "repeat compressed again"))
+
+    if failures:
+        raise SystemExit(f"❌ Compression mismatches: {failures}")
+    print("✅ Compressed responses match.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Compare approx=true distinct counts from the sketch tables with exact SQL.
+
+Runs the Flask app in-process against the configured database, after
+build_sketches.py has run:
+    python scripts/check_sketches.py
+
+Estimates must be within 3 standard errors (about 4.9% at P = 12), or two
+counts for small buckets where register collisions dominate.
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src" / "api"))
+import app as api  # noqa: E402
+import hll  # noqa: E402
+
+RANGES = [
+    ("2025-06-21", "2025-12-17"),
+    ("2025-09-01", "2025-09-30"),
+    ("2025-10-05", "2025-10-11"),
+]
+
+MAX_REL_ERROR = 3 * float(hll.STD_ERROR)
+MAX_ABS_ERROR = 2
+
+def rel_error(approx: float, exact: float) -> float:
+    return abs(approx - exact) / exact if exact else float(approx != 0)
+
+def main():
+    client = api.app.test_client()
+    failures = []
+
+    def compare(label, approx, exact):
+        err = rel_error(approx, exact)
+        ok = err <= MAX_REL_ERROR or abs(approx - exact) <= MAX_ABS_ERROR
+        print(f"{label}: exact={exact} approx={approx} error={err:.2%} -> {'OK' if ok else 'FAIL'}")
+        if not ok:
+            failures.append(label)
+
+    for start, end in RANGES:
+        q = f"start={start}&end={end}"
+        exact = client.get(f"/kpis?{q}").get_json()["kpis"]
+        approx = client.get(f"/kpis?{q}&approx=true").get_json()["kpis"]
+        compare(f"kpis orders {start}..{end}", approx["orders"], exact["orders"])
+
+        exact = {r["category"]: r["orders"] for r in client.get(f"/revenue/by-category?{q}").get_json()["data"]}
+        approx = {r["category"]: r["orders"] for r in client.get(f"/revenue/by-category?{q}&approx=true").get_json()["data"]}
+        for category in exact:
+            compare(f"category {category} orders {start}..{end}", approx.get(category, 0), exact[category])
+
+        for g in ["day", "month"]:
+            exact = {r["day"]: r["orders"] for r in client.get(f"/revenue/by-day?{q}&granularity={g}").get_json()["data"]}
+            approx = {r["day"]: r["orders"] for r in client.get(f"/revenue/by-day?{q}&granularity={g}&approx=true").get_json()["data"]}
+            worst = max(exact, key=lambda d: rel_error(approx.get(d, 0), exact[d]))
+            compare(f"by-{g} worst bucket {worst}", approx.get(worst, 0), exact[worst])
+
+    if failures:
+        raise SystemExit(f"❌ Sketch estimates out of bounds: {failures}")
+    print("✅ Sketch estimates are within bounds.")
+
+if __name__ == "__main__":
+    main()
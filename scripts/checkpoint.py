@@ -0,0 +1,134 @@
+"""Pipeline run state for `run_pipeline.py --resume`.
+
+Stage level: every run gets a row in public.pipeline_runs and one row per
+stage in public.pipeline_stages (input hash, rows loaded, status, finish
+time). A resumed run skips stages that finished in the previous run with
+the same input hash and restarts from the first one that failed, never ran,
+or whose input (raw file or stage script) changed.
+
+Batch level: large stages commit in batches and record how many batches are
+done in public.pipeline_checkpoints, keyed by an id of their input. When a
+resumed run finds a checkpoint for the same input it continues after the
+last committed batch instead of starting the stage over.
+"""
+import os
+import hashlib
+
+from sqlalchemy import text
+
+SCHEMA = "public"
+
+DDL = f"""
+CREATE TABLE IF NOT EXISTS {SCHEMA}.pipeline_runs (
+  run_id      BIGSERIAL PRIMARY KEY,
+  resumed     BOOLEAN NOT NULL DEFAULT false,
+  started_at  TIMESTAMPTZ NOT NULL DEFAULT now(),
+  finished_at TIMESTAMPTZ,
+  status      TEXT NOT NULL DEFAULT 'running'
+);
+CREATE TABLE IF NOT EXISTS {SCHEMA}.pipeline_stages (
+  run_id      BIGINT NOT NULL REFERENCES {SCHEMA}.pipeline_runs (run_id),
+  stage       TEXT NOT NULL,
+  input_hash  TEXT,
+  rows        BIGINT,
+  status      TEXT NOT NULL,
+  finished_at TIMESTAMPTZ,
+  PRIMARY KEY (run_id, stage)
+);
+CREATE TABLE IF NOT EXISTS {SCHEMA}.pipeline_checkpoints (
+  stage      TEXT PRIMARY KEY,
+  input_id   TEXT NOT NULL,
+  batches    INT NOT NULL,
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+"""
+
+
+def resuming() -> bool:
+    """Set by run_pipeline.py --resume, for this process and its subprocesses."""
+    return os.getenv("PIPELINE_RESUME", "0") == "1"
+
+
+def input_hash(paths) -> str:
+    """sha256 over the contents of `paths`, in order."""
+    h = hashlib.sha256()
+    for p in paths:
+        h.update(str(p).encode("utf-8") + b"\0")
+        with open(p, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+    return h.hexdigest()
+
+
+# -----------------------
+# Stage level
+# -----------------------
+def start_run(engine, resumed: bool) -> int:
+    with engine.begin() as conn:
+        conn.execute(text(DDL))
+        return conn.execute(
+            text(f"INSERT INTO {SCHEMA}.pipeline_runs (resumed) VALUES (:r) RETURNING run_id"),
+            {"r": resumed},
+        ).scalar_one()
+
+
+def previous_stages(engine, run_id: int) -> dict:
+    """stage -> (status, input_hash, rows, finished_at) from the run before `run_id`."""
+    with engine.begin() as conn:
+        rows = conn.execute(text(f"""
+            SELECT stage, status, input_hash, rows, finished_at
+            FROM {SCHEMA}.pipeline_stages
+            WHERE run_id = (SELECT MAX(run_id) FROM {SCHEMA}.pipeline_runs WHERE run_id < :run_id)
+        """), {"run_id": run_id}).all()
+    return {r.stage: (r.status, r.input_hash, r.rows, r.finished_at) for r in rows}
+
+
+def record_stage(engine, run_id: int, stage: str, status: str,
+                 input_hash: str = None, rows: int = None, finished_at=None):
+    with engine.begin() as conn:
+        conn.execute(text(f"""
+            INSERT INTO {SCHEMA}.pipeline_stages (run_id, stage, input_hash, rows, status, finished_at)
+            VALUES (:run_id, :stage, :input_hash, :rows, :status, COALESCE(:finished_at, now()))
+            ON CONFLICT (run_id, stage) DO UPDATE SET
+              input_hash = EXCLUDED.input_hash, rows = EXCLUDED.rows,
+              status = EXCLUDED.status, finished_at = EXCLUDED.finished_at
+        """), {"run_id": run_id, "stage": stage, "input_hash": input_hash, "rows": rows,
+               "status": status, "finished_at": finished_at})
+
+
+def finish_run(engine, run_id: int, status: str):
+    with engine.begin() as conn:
+        conn.execute(
+            text(f"UPDATE {SCHEMA}.pipeline_runs SET status = :s, finished_at = now() WHERE run_id = :r"),
+            {"s": status, "r": run_id},
+        )
+
+
+# -----------------------
+# Batch level
+# -----------------------
+def batches_done(engine, stage: str, input_id: str) -> int:
+    """Batches already committed for this input, or 0 to start the stage over."""
+    with engine.begin() as conn:
+        conn.execute(text(DDL))
+        if not resuming():
+            return 0
+        row = conn.execute(
+            text(f"SELECT input_id, batches FROM {SCHEMA}.pipeline_checkpoints WHERE stage = :s"),
+            {"s": stage},
+        ).first()
+    return row.batches if row is not None and row.input_id == input_id else 0
+
+
+def save_batches(conn, stage: str, input_id: str, batches: int):
+    """Record progress; call inside the transaction that committed the batch."""
+    conn.execute(text(f"""
+        INSERT INTO {SCHEMA}.pipeline_checkpoints (stage, input_id, batches, updated_at)
+        VALUES (:s, :i, :b, now())
+        ON CONFLICT (stage) DO UPDATE SET
+          input_id = EXCLUDED.input_id, batches = EXCLUDED.batches, updated_at = now()
+    """), {"s": stage, "i": input_id, "b": batches})
+
+
+def clear_batches(conn, stage: str):
+    conn.execute(text(f"DELETE FROM {SCHEMA}.pipeline_checkpoints WHERE stage = :s"), {"s": stage})
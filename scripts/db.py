@@ -0,0 +1,35 @@
+import os
+from sqlalchemy import create_engine, text
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DB_HOST = os.getenv("DB_HOST", "localhost")
+DB_PORT = os.getenv("DB_PORT", "5432")
+DB_NAME = os.getenv("DB_NAME", "demo_dw")
+DB_USER = os.getenv("DB_USER", "demo_user")
+DB_PASSWORD = os.getenv("DB_PASSWORD", "demo_pass")
+
+
+def make_engine():
+    """One engine (and connection pool) per process. DATABASE_URL wins over DB_* values."""
+    database_url = os.getenv("DATABASE_URL")
+    if database_url:
+        return create_engine(database_url)
+    return create_engine(
+        f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+    )
+
+
+def bump_dataset_version(engine) -> int:
+    """Record a finished pipeline run. The API keys caches and coalescing on this."""
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS public.dataset_version (
+              version BIGSERIAL PRIMARY KEY,
+              loaded_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            );
+        """))
+        return conn.execute(text(
+            "INSERT INTO public.dataset_version DEFAULT VALUES RETURNING version;"
+        )).scalar_one()
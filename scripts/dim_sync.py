@@ -0,0 +1,104 @@
+import hashlib
+import pandas as pd
+from sqlalchemy import text
+
+SCHEMA = "public"
+
+def row_hashes(df: pd.DataFrame, cols: list) -> pd.Series:
+    """md5 of each row's values in `cols` order (stable across runs for the same input)."""
+    joined = df[cols].astype(str).agg("\x1f".join, axis=1)
+    return joined.map(lambda s: hashlib.md5(s.encode("utf-8")).hexdigest())
+
+def sync_dimension(engine, df: pd.DataFrame, table: str, key: str, cols: list,
+                   history: bool = False, partial: bool = False) -> dict:
+    """Apply only the inserts, updates and soft deletes needed to match `df`.
+
+    Hashes of the incoming rows are compared with the row_hash stored on the
+    table, so an unchanged day reads one narrow column and writes nothing.
+    Rows missing from the input get deleted_at set instead of being removed,
+    which keeps fact rows pointing at them valid. With history=True, a
+    {table}_history copy keeps every version with valid_from/valid_to (type 2).
+    partial=True means `df` is only the changed slice (an incremental pull),
+    so missing rows are left alone instead of soft-deleted.
+    """
+    df = df[cols].copy()
+    df["row_hash"] = row_hashes(df, cols)
+
+    with engine.begin() as conn:
+        conn.execute(text(f"""
+            ALTER TABLE {SCHEMA}.{table}
+              ADD COLUMN IF NOT EXISTS row_hash TEXT,
+              ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMPTZ;
+        """))
+        stored = pd.read_sql(
+            text(f"SELECT {key}, row_hash, deleted_at IS NOT NULL AS deleted FROM {SCHEMA}.{table}"),
+            conn,
+        )
+
+        merged = df[[key, "row_hash"]].merge(stored, on=key, how="outer", suffixes=("", "_stored"), indicator=True)
+        new_keys = merged.loc[merged["_merge"] == "left_only", key]
+        changed_keys = merged.loc[
+            (merged["_merge"] == "both")
+            & ((merged["row_hash"] != merged["row_hash_stored"]) | merged["deleted"].astype(bool)),
+            key,
+        ]
+        gone_keys = merged.loc[(merged["_merge"] == "right_only") & ~merged["deleted"].astype(bool), key]
+        if partial:
+            gone_keys = gone_keys.iloc[:0]
+
+        inserts = df[df[key].isin(new_keys)]
+        updates = df[df[key].isin(changed_keys)]
+
+        if len(inserts):
+            inserts.to_sql(table, conn, schema=SCHEMA, if_exists="append", index=False)
+        if len(updates):
+            assignments = ", ".join(f"{c} = :{c}" for c in cols + ["row_hash"] if c != key)
+            conn.execute(
+                text(f"UPDATE {SCHEMA}.{table} SET {assignments}, deleted_at = NULL WHERE {key} = :{key}"),
+                updates.to_dict("records"),
+            )
+        if len(gone_keys):
+            conn.execute(
+                text(f"UPDATE {SCHEMA}.{table} SET deleted_at = now() WHERE {key} = ANY(:keys)"),
+                {"keys": [int(k) for k in gone_keys]},
+            )
+
+        if history:
+            _apply_history(conn, table, key, list(changed_keys) + list(gone_keys))
+
+    report = {
+        "inserted": len(inserts),
+        "updated": len(updates),
+        "deleted": len(gone_keys),
+        "unchanged": len(df) - len(inserts) - len(updates),
+    }
+    return report
+
+def _apply_history(conn, table: str, key: str, closed_keys: list):
+    history = f"{table}_history"
+    conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {SCHEMA}.{history} (
+          LIKE {SCHEMA}.{table},
+          valid_from TIMESTAMPTZ NOT NULL,
+          valid_to   TIMESTAMPTZ
+        );
+        CREATE INDEX IF NOT EXISTS {history}_current_idx
+          ON {SCHEMA}.{history} ({key}) WHERE valid_to IS NULL;
+    """))
+    if closed_keys:
+        conn.execute(
+            text(f"UPDATE {SCHEMA}.{history} SET valid_to = now() WHERE valid_to IS NULL AND {key} = ANY(:keys)"),
+            {"keys": [int(k) for k in closed_keys]},
+        )
+    # Open a version for every live row without one: new rows, rows just
+    # updated, and (the first time history is enabled) everything else.
+    conn.execute(text(f"""
+        INSERT INTO {SCHEMA}.{history}
+        SELECT t.*, now(), NULL
+        FROM {SCHEMA}.{table} t
+        WHERE t.deleted_at IS NULL
+          AND NOT EXISTS (
+            SELECT 1 FROM {SCHEMA}.{history} h
+            WHERE h.{key} = t.{key} AND h.valid_to IS NULL
+          );
+    """))
@@ -1,40 +1,44 @@
 import os
 import json
+import argparse
 import pandas as pd
-from sqlalchemy import create_engine, text
-from dotenv import load_dotenv
+from sqlalchemy import text
 
-load_dotenv()
-
-DB_HOST = os.getenv("DB_HOST")
-DB_PORT = os.getenv("DB_PORT")
-DB_NAME = os.getenv("DB_NAME")
-DB_USER = os.getenv("DB_USER")
-DB_PASSWORD = os.getenv("DB_PASSWORD")
+from db import make_engine
+import profile_cli
+from dim_sync import sync_dimension
+import schemas
 
 CUSTOMERS_PATH = "data/raw/customers.json"
 
-def main():
+COLUMNS = ["customer_id", "full_name", "email", "country", "segment", "created_at"]
+
+# "full" truncates and reloads; "diff" applies only the row-level changes
+# (see dim_sync.py). DIM_HISTORY=1 also keeps type-2 history in diff mode.
+LOAD_MODE = os.getenv("DIM_LOAD_MODE", "full")
+KEEP_HISTORY = os.getenv("DIM_HISTORY", "0") == "1"
+
+def read_file() -> pd.DataFrame:
     with open(CUSTOMERS_PATH, "r", encoding="utf-8") as f:
-        data = json.load(f)
+        return pd.DataFrame(json.load(f))
 
-    df = pd.DataFrame(data)
-    df["created_at"] = pd.to_datetime(df["created_at"])
+def load(engine, mode: str = None, history: bool = None) -> int:
+    df = schemas.parse_source("customers", read_file)
 
-    DATABASE_URL = os.getenv("DATABASE_URL")
-    if DATABASE_URL:
-        engine = create_engine(DATABASE_URL)
-    else:
-        engine = create_engine(
-            f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-        )
+    mode = mode or LOAD_MODE
+    if mode == "diff":
+        # Mostly append-only: usually just the new customers get written
+        report = sync_dimension(engine, df, "customers", "customer_id", COLUMNS,
+                                history=KEEP_HISTORY if history is None else history)
+        print(f"✅ Synced {len(df)} customers: {report}")
+        return report["inserted"] + report["updated"] + report["deleted"]
 
     # ✅ Clear table first so append doesn't duplicate rows
     with engine.begin() as conn:
         conn.execute(text("TRUNCATE TABLE public.customers CASCADE;"))
 
 
-    df[["customer_id", "full_name", "email", "country", "segment", "created_at"]].to_sql(
+    df[COLUMNS].to_sql(
         "customers",
         engine,
         schema="public",
@@ -43,6 +47,17 @@ def main():
     )
 
     print(f"✅ Loaded {len(df)} customers into Postgres.")
+    return len(df)
+
+def main():
+    parser = argparse.ArgumentParser(description="Load customers.")
+    parser.add_argument("--mode", choices=["full", "diff"], default=LOAD_MODE)
+    parser.add_argument("--history", action="store_true", default=KEEP_HISTORY,
+                        help="Keep type-2 history (diff mode only).")
+    profile_cli.add_argument(parser)
+    args = parser.parse_args()
+    profile_cli.run("load_customers", args.profile, vars(args),
+                    load, make_engine(), mode=args.mode, history=args.history)
 
 if __name__ == "__main__":
     main()
@@ -1,41 +1,32 @@
-import os
+import argparse
 import pandas as pd
-from sqlalchemy import create_engine, text
-from dotenv import load_dotenv
+from sqlalchemy import text
 
-load_dotenv()
-
-DB_HOST = os.getenv("DB_HOST", "localhost")
-DB_PORT = os.getenv("DB_PORT", "5432")
-DB_NAME = os.getenv("DB_NAME", "demo_dw")
-DB_USER = os.getenv("DB_USER", "demo_user")
-DB_PASSWORD = os.getenv("DB_PASSWORD", "demo_pass")
+from db import make_engine
+import profile_cli
+import schemas
 
 MARKETING_PATH = "data/raw/marketing.csv"
 SCHEMA = "public"
 TABLE = "marketing_spend"
 
-def main():
-    df = pd.read_csv(MARKETING_PATH)
-    df["date"] = pd.to_datetime(df["date"]).dt.date
-    df["spend_eur"] = pd.to_numeric(df["spend_eur"], errors="raise").round(2)
-
-    DATABASE_URL = os.getenv("DATABASE_URL")
-    
-    if  DATABASE_URL:
-        engine = create_engine(DATABASE_URL)
-    else:
-        engine = create_engine(
-        f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-    )    
+def load(engine) -> int:
+    df = schemas.parse_source("marketing", lambda: pd.read_csv(MARKETING_PATH))
 
     # simple: replace all rows each run
     with engine.begin() as conn:
         conn.execute(text(f"TRUNCATE TABLE {SCHEMA}.{TABLE};"))
 
-    df.to_sql(TABLE, engine, schema=SCHEMA, if_exists="append", index=False)
+    schemas.for_sql(df, "marketing").to_sql(TABLE, engine, schema=SCHEMA, if_exists="append", index=False)
 
     print(f"✅ Loaded {len(df)} rows into {SCHEMA}.{TABLE}")
+    return len(df)
+
+def main():
+    parser = argparse.ArgumentParser(description="Load marketing spend.")
+    profile_cli.add_argument(parser)
+    args = parser.parse_args()
+    profile_cli.run("load_marketing", args.profile, vars(args), load, make_engine())
 
 if __name__ == "__main__":
     main()
@@ -1,64 +1,179 @@
 import os
+import sys
 import json
+import argparse
+from pathlib import Path
+
 import pandas as pd
-from sqlalchemy import create_engine, text
-from dotenv import load_dotenv
+from sqlalchemy import text
 
-load_dotenv()
+from db import make_engine
+import profile_cli
+import extract_api
+import checkpoint
+import schemas
+import parallel_load
 
-DB_HOST = os.getenv("DB_HOST", "localhost")
-DB_PORT = os.getenv("DB_PORT", "5432")
-DB_NAME = os.getenv("DB_NAME", "demo_dw")
-DB_USER = os.getenv("DB_USER", "demo_user")
-DB_PASSWORD = os.getenv("DB_PASSWORD", "demo_pass")
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src" / "api"))
+import archive  # noqa: E402
 
 ORDERS_PATH = "data/raw/orders_api.json"
 SCHEMA = "public"
 TABLE = "order_lines"
+STAGE = "load_orders"
+STAGING = f"{TABLE}_load"
 
-def main():
-    # 1) Read JSON
+# Full loads commit at most this many rows per batch (one page per batch when
+# pulling from the API), so a resumed run can pick up after the last committed
+# batch. Batches are written by parallel_load.LOAD_WORKERS processes at once.
+ORDERS_BATCH_SIZE = int(os.getenv("ORDERS_BATCH_SIZE", "50000"))
+
+COLUMNS = [
+    "order_line_id", "order_id", "order_timestamp",
+    "customer_id", "product_id", "qty",
+    "gross_revenue", "discount_amount", "net_revenue",
+    "currency"
+]
+
+def read_file() -> pd.DataFrame:
     with open(ORDERS_PATH, "r", encoding="utf-8") as f:
         payload = json.load(f)
+    return pd.DataFrame(payload["data"])
+
+def read_batches(workers: int, keep=None) -> list:
+    """The file's rows (those `keep` returns, if given) as order_line_id ranges of at most
+    ORDERS_BATCH_SIZE rows, at least one per worker."""
+    df = schemas.parse_source("orders", read_file)
+    if keep is not None:
+        df = keep(df)
+    return parallel_load.key_ranges(df, "order_line_id", ORDERS_BATCH_SIZE, workers)
 
-    df = pd.DataFrame(payload["data"])
+def late_rows_note(late: int) -> None:
+    if late:
+        print(f"⚠️ {late} late order lines for archived months went to {SCHEMA}.{TABLE}; "
+              f"archive_cold merges them into the archive")
 
-    # 2) Clean / types
-    df["order_timestamp"] = pd.to_datetime(df["order_timestamp"])
+def load(engine, incremental: bool = None, workers: int = None) -> int:
+    incremental = extract_api.EXTRACT_INCREMENTAL if incremental is None else incremental
+    if extract_api.SOURCE_API_URL and incremental:
+        return load_incremental(engine)
 
-    int_cols = ["order_line_id", "order_id", "customer_id", "product_id", "qty"]
-    for c in int_cols:
-        df[c] = pd.to_numeric(df[c], errors="raise").astype(int)
+    workers = workers or parallel_load.LOAD_WORKERS
 
-    money_cols = ["gross_revenue", "discount_amount", "net_revenue"]
-    for c in money_cols:
-        df[c] = pd.to_numeric(df[c], errors="raise").round(2)
+    # Months before the archive boundary live in the archive: rows it already
+    # holds are skipped, late ones are loaded for archive_cold to merge.
+    with engine.begin() as conn:
+        boundary, archived_months = archive.boundary(conn), archive.months(conn)
+    late = 0
+
+    def hot_rows(df):
+        nonlocal late
+        df, n = archive.drop_archived(df, TABLE, boundary, archived_months)
+        late += n
+        return df
 
-    # 3) Connect to Postgres
-    DATABASE_URL = os.getenv("DATABASE_URL")
-    
-    if  DATABASE_URL:
-        engine = create_engine(DATABASE_URL)
+    # 1) Batches come from the source API when SOURCE_API_URL is set, else from the file.
+    # A resumed pipeline run skips the batches a crashed run already committed.
+    if extract_api.SOURCE_API_URL:
+        # The stored cursor moves with every completed load, so a checkpoint
+        # left by an earlier extract of the source never matches a later one.
+        cursor = extract_api.read_cursor(engine, "orders")
+        input_id = (f"{extract_api.SOURCE_API_URL}|page_size={extract_api.EXTRACT_PAGE_SIZE}"
+                    f"|cursor={cursor}|boundary={boundary}")
+        done = checkpoint.batches_done(engine, STAGE, input_id)
+        batches = (hot_rows(schemas.parse(pd.DataFrame(page), "orders")) if page else None
+                   for page in extract_api.iter_pages("orders", start_page=done + 1))
     else:
-        engine = create_engine(
-        f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-    )    
+        ranges = read_batches(workers, hot_rows)
+        # The split depends on the worker count and the boundary, so both are part of the input id.
+        input_id = f"{checkpoint.input_hash([ORDERS_PATH])}|batches={len(ranges)}|boundary={boundary}"
+        done = checkpoint.batches_done(engine, STAGE, input_id)
+        batches = ranges[done:]
+
+    # 2) Stage the batches next to the live table, one commit per batch, in parallel
+    if not done:
+        parallel_load.create_staging(engine, SCHEMA, TABLE, STAGING, stage=STAGE)
+
+    def progress(n):
+        with engine.begin() as conn:
+            checkpoint.save_batches(conn, STAGE, input_id, n)
+
+    stats = parallel_load.write(engine, SCHEMA, STAGING, "orders", COLUMNS, batches, workers,
+                                first_batch=done + 1, replace=bool(done), on_progress=progress)
 
-    # 4) Beginner-safe approach: clear table then load fresh
+    # 3) Rename the staged table into place, in one transaction, so readers never
+    # see a partial load and no row is written a second time
+    loaded = parallel_load.prepare_swap(engine, SCHEMA, TABLE, STAGING)
     with engine.begin() as conn:
-        conn.execute(text(f"TRUNCATE TABLE {SCHEMA}.{TABLE};"))
+        parallel_load.swap(conn, SCHEMA, TABLE, STAGING)
+        checkpoint.clear_batches(conn, STAGE)
 
-    # 5) Load
-    cols = [
-        "order_line_id", "order_id", "order_timestamp",
-        "customer_id", "product_id", "qty",
-        "gross_revenue", "discount_amount", "net_revenue",
-        "currency"
-    ]
+        if extract_api.SOURCE_API_URL:
+            cursor = conn.execute(text(f"SELECT MAX(order_timestamp) FROM {SCHEMA}.{TABLE}")).scalar()
+            if cursor is not None:
+                extract_api.save_cursor(conn, "orders", cursor.isoformat())
 
-    df[cols].to_sql(TABLE, engine, schema=SCHEMA, if_exists="append", index=False)
+        # 4) Index used by range filters and keyset pagination in the API
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS order_lines_ts_id_idx "
+            f"ON {SCHEMA}.{TABLE} (order_timestamp, order_line_id);"
+        ))
 
-    print(f"✅ Loaded {len(df)} order lines into {SCHEMA}.{TABLE}")
+    resumed = f", resumed after batch {done}" if done else ""
+    archived = f", lines before {boundary} are archived" if boundary else ""
+    print(f"✅ Loaded {loaded} order lines into {SCHEMA}.{TABLE} "
+          f"(staged {parallel_load.describe(stats)}{resumed}{archived})")
+    late_rows_note(late)
+    return loaded
+
+def load_incremental(engine) -> int:
+    """Append lines pulled since the stored cursor, in one transaction.
+
+    Late lines for archived months are loaded too, as in full loads, for
+    archive_cold to merge into their month.
+    """
+    since = extract_api.read_cursor(engine, "orders")
+    loaded = late = 0
+    cursor = since
+    with engine.begin() as conn:
+        boundary, archived_months = archive.boundary(conn), archive.months(conn)
+        for page in extract_api.iter_pages("orders", since=since):
+            if not page:
+                continue
+            df = schemas.parse(pd.DataFrame(page), "orders")
+            df, n = archive.drop_archived(df, TABLE, boundary, archived_months)
+            late += n
+
+            # `since` is inclusive, so skip lines an earlier pull already loaded
+            existing = conn.execute(
+                text(f"SELECT order_line_id FROM {SCHEMA}.{TABLE} WHERE order_line_id = ANY(:ids)"),
+                {"ids": df["order_line_id"].tolist()},
+            ).scalars().all()
+            df = df[~df["order_line_id"].isin(existing)]
+
+            schemas.for_sql(df, "orders")[COLUMNS].to_sql(TABLE, conn, schema=SCHEMA, if_exists="append", index=False)
+            loaded += len(df)
+            page_max = df["order_timestamp"].max() if len(df) else None
+            if page_max is not None and (cursor is None or page_max.isoformat() > cursor):
+                cursor = page_max.isoformat()
+
+        if cursor:
+            extract_api.save_cursor(conn, "orders", cursor)
+
+    print(f"✅ Loaded {loaded} order lines into {SCHEMA}.{TABLE}" + (f" (since {since})" if since else ""))
+    late_rows_note(late)
+    return loaded
+
+def main():
+    parser = argparse.ArgumentParser(description="Load order lines.")
+    parser.add_argument("--incremental", action="store_true", default=extract_api.EXTRACT_INCREMENTAL,
+                        help="With SOURCE_API_URL, only pull lines since the last loaded cursor.")
+    parser.add_argument("--workers", type=int, default=parallel_load.LOAD_WORKERS,
+                        help="Processes (and connections) writing batches in parallel (default LOAD_WORKERS).")
+    profile_cli.add_argument(parser)
+    args = parser.parse_args()
+    profile_cli.run("load_orders", args.profile, vars(args),
+                    load, make_engine(), incremental=args.incremental, workers=args.workers)
 
 if __name__ == "__main__":
     main()
@@ -1,53 +1,92 @@
 import os
 import json
+import argparse
 import pandas as pd
-from sqlalchemy import create_engine, text
-from dotenv import load_dotenv
+from sqlalchemy import text
 
-load_dotenv()
-
-DB_HOST = os.getenv("DB_HOST")
-DB_PORT = os.getenv("DB_PORT")
-DB_NAME = os.getenv("DB_NAME")
-DB_USER = os.getenv("DB_USER")
-DB_PASSWORD = os.getenv("DB_PASSWORD")
+from db import make_engine
+import profile_cli
+from dim_sync import sync_dimension
+import extract_api
+import schemas
 
 PRODUCTS_PATH = "data/raw/products_api.json"
 
-def main():
-    # 1) Read JSON
+COLUMNS = ["product_id", "name", "category", "price", "is_active", "updated_at"]
+
+# "full" truncates and reloads; "diff" applies only the row-level changes
+# (see dim_sync.py). DIM_HISTORY=1 also keeps type-2 history in diff mode.
+LOAD_MODE = os.getenv("DIM_LOAD_MODE", "full")
+KEEP_HISTORY = os.getenv("DIM_HISTORY", "0") == "1"
+
+def read_pages():
+    """The whole file as a single page."""
     with open(PRODUCTS_PATH, "r", encoding="utf-8") as f:
         payload = json.load(f)
+    yield payload["data"]
 
-    df = pd.DataFrame(payload["data"])
+def load(engine, mode: str = None, history: bool = None, incremental: bool = None) -> int:
+    # 1) Pages come from the source API when SOURCE_API_URL is set, else from the file
+    incremental = extract_api.EXTRACT_INCREMENTAL if incremental is None else incremental
+    since = None
+    if extract_api.SOURCE_API_URL:
+        if incremental:
+            since = extract_api.read_cursor(engine, "products")
+        pages = extract_api.iter_pages("products", since=since)
+    else:
+        incremental = False
+        pages = read_pages()
 
-    # 2) Clean types
-    df["updated_at"] = pd.to_datetime(df["updated_at"])
+    # 2) Parse through the schema registry. Products are small, so the pages
+    # are simply collected
+    df = schemas.parse_source("products", lambda: pd.concat(
+        [pd.DataFrame(page) for page in pages if page] or [pd.DataFrame(columns=COLUMNS)],
+        ignore_index=True,
+    ))
+    df = schemas.for_sql(df, "products")
 
-    # 3) Connect to Postgres
-    DATABASE_URL = os.getenv("DATABASE_URL")
-    if DATABASE_URL:
-        engine = create_engine(DATABASE_URL)
-    else:
-        engine = create_engine(
-            f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-        )
+    mode = mode or LOAD_MODE
+    if mode == "diff" or incremental:
+        # 3) Only touch rows whose content changed; an incremental pull is a
+        # partial slice, so it never soft-deletes the products it didn't see
+        report = sync_dimension(engine, df, "products", "product_id", COLUMNS,
+                                history=KEEP_HISTORY if history is None else history,
+                                partial=incremental)
+        if extract_api.SOURCE_API_URL and len(df):
+            with engine.begin() as conn:
+                extract_api.save_cursor(conn, "products", df["updated_at"].max().isoformat())
+        print(f"✅ Synced {len(df)} products: {report}")
+        return report["inserted"] + report["updated"] + report["deleted"]
 
-    # ✅ 4) Clear table first (so append doesn’t duplicate)
     with engine.begin() as conn:
+        # ✅ 3) Clear table first (so append doesn’t duplicate)
         conn.execute(text("TRUNCATE TABLE public.products CASCADE;"))
 
-
-    # 5) Load fresh data
-    df[["product_id", "name", "category", "price", "is_active", "updated_at"]].to_sql(
-        "products",
-        engine,
-        schema="public",
-        if_exists="append",
-        index=False,
-    )
+        # 4) Load fresh data
+        df[COLUMNS].to_sql(
+            "products",
+            conn,
+            schema="public",
+            if_exists="append",
+            index=False,
+        )
+        if extract_api.SOURCE_API_URL and len(df):
+            extract_api.save_cursor(conn, "products", df["updated_at"].max().isoformat())
 
     print(f"✅ Loaded {len(df)} products into Postgres.")
+    return len(df)
+
+def main():
+    parser = argparse.ArgumentParser(description="Load products.")
+    parser.add_argument("--mode", choices=["full", "diff"], default=LOAD_MODE)
+    parser.add_argument("--history", action="store_true", default=KEEP_HISTORY,
+                        help="Keep type-2 history (diff mode only).")
+    parser.add_argument("--incremental", action="store_true", default=extract_api.EXTRACT_INCREMENTAL,
+                        help="With SOURCE_API_URL, only pull products changed since the last cursor.")
+    profile_cli.add_argument(parser)
+    args = parser.parse_args()
+    profile_cli.run("load_products", args.profile, vars(args),
+                    load, make_engine(), mode=args.mode, history=args.history, incremental=args.incremental)
 
 if __name__ == "__main__":
     main()
@@ -1,50 +1,65 @@
-import os
+import sys
+import argparse
+from pathlib import Path
+
 import pandas as pd
-from sqlalchemy import create_engine, text
-from dotenv import load_dotenv
 
-load_dotenv()
+from db import make_engine
+import profile_cli
+import schemas
+import parallel_load
 
-DB_HOST = os.getenv("DB_HOST", "localhost")
-DB_PORT = os.getenv("DB_PORT", "5432")
-DB_NAME = os.getenv("DB_NAME", "demo_dw")
-DB_USER = os.getenv("DB_USER", "demo_user")
-DB_PASSWORD = os.getenv("DB_PASSWORD", "demo_pass")
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src" / "api"))
+import archive  # noqa: E402
 
 RETURNS_PATH = "data/raw/returns.xlsx"
 SCHEMA = "public"
 TABLE = "returns"
+STAGING = f"{TABLE}_load"
 
-def main():
-    df = pd.read_excel(RETURNS_PATH, sheet_name="returns")
-
-    # types
-    df["order_timestamp"] = pd.to_datetime(df["order_timestamp"])
-    df["refund_timestamp"] = pd.to_datetime(df["refund_timestamp"])
-    df["refund_amount"] = pd.to_numeric(df["refund_amount"], errors="raise").round(2)
-
-    int_cols = ["order_line_id", "order_id", "customer_id", "product_id"]
-    for c in int_cols:
-        df[c] = pd.to_numeric(df[c], errors="raise").astype(int)
-
-    DATABASE_URL = os.getenv("DATABASE_URL")
-    
-    if  DATABASE_URL:
-        engine = create_engine(DATABASE_URL)
-    else:
-        engine = create_engine(
-        f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-    )    
-
-    # replace all rows each run
+# Rows per batch; batches are written by parallel_load.LOAD_WORKERS processes at once.
+RETURNS_BATCH_SIZE = 50000
+
+COLUMNS = [
+    "order_line_id", "order_id", "customer_id", "product_id",
+    "order_timestamp", "refund_timestamp", "refund_amount", "reason",
+]
+
+def read_file() -> pd.DataFrame:
+    return pd.read_excel(RETURNS_PATH, sheet_name="returns")
+
+def load(engine, workers: int = None) -> int:
+    workers = workers or parallel_load.LOAD_WORKERS
+
+    # types come from the schema registry; returns the archive already holds
+    # are skipped, late ones for archived months are loaded for archive_cold
     with engine.begin() as conn:
-        conn.execute(text(f"TRUNCATE TABLE {SCHEMA}.{TABLE};"))
+        boundary, archived_months = archive.boundary(conn), archive.months(conn)
+    df, late = archive.drop_archived(schemas.parse_source("returns", read_file), TABLE, boundary, archived_months)
 
-    df.to_sql(TABLE, engine, schema=SCHEMA, if_exists="append", index=False)
+    # stage order_line_id ranges in parallel, then rename the staged table into place
+    parallel_load.create_staging(engine, SCHEMA, TABLE, STAGING)
+    batches = parallel_load.key_ranges(df, "order_line_id", RETURNS_BATCH_SIZE, workers)
+    stats = parallel_load.write(engine, SCHEMA, STAGING, "returns", COLUMNS, batches, workers)
 
-    print(f"✅ Loaded {len(df)} returns into {SCHEMA}.{TABLE}")
+    loaded = parallel_load.prepare_swap(engine, SCHEMA, TABLE, STAGING)
+    with engine.begin() as conn:
+        parallel_load.swap(conn, SCHEMA, TABLE, STAGING)
 
-if __name__ == "__main__":
-    main()
+    archived = f", returns of orders before {boundary} are archived" if boundary else ""
+    print(f"✅ Loaded {loaded} returns into {SCHEMA}.{TABLE} (staged {parallel_load.describe(stats)}{archived})")
+    if late:
+        print(f"⚠️ {late} late returns for archived months went to {SCHEMA}.{TABLE}; "
+              f"archive_cold merges them into the archive")
+    return loaded
 
+def main():
+    parser = argparse.ArgumentParser(description="Load returns.")
+    parser.add_argument("--workers", type=int, default=parallel_load.LOAD_WORKERS,
+                        help="Processes (and connections) writing batches in parallel (default LOAD_WORKERS).")
+    profile_cli.add_argument(parser)
+    args = parser.parse_args()
+    profile_cli.run("load_returns", args.profile, vars(args), load, make_engine(), workers=args.workers)
 
+if __name__ == "__main__":
+    main()
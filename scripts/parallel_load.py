@@ -0,0 +1,218 @@
+"""Parallel staging writes for the large fact loaders (orders, returns).
+
+The input is cut into batches (contiguous key ranges of the file, or API
+pages). A process pool of LOAD_WORKERS workers writes them into the
+loader's staging table. Workers are started with forkserver (spawn where
+that is unavailable), never forked from the loader, and each builds its own
+engine from the database URL, so it has its own connection and Postgres
+backend and the caller's engine is left alone. Every batch is its own transaction and
+its rows carry the batch number in a `load_batch` column. The loader then
+swaps the staging table into the live one in a single transaction, so the
+load as a whole still commits atomically and readers never see part of it.
+
+The swap is a rename, not a second write of every row. Before it,
+`prepare_swap()` builds the live table's indexes on the staging table (under
+temporary names, while readers still use the live table) and analyzes it.
+`swap()` then drops the live table, renames the staging table into its place
+and gives the indexes, constraints and grants their old names and owners, all
+in the caller's transaction. A view on the live table would block the DROP;
+there are none.
+
+Batches finish out of order. `write()` reports progress only for the
+leading run of committed batches, which is what a resumed run skips. A
+batch past that point may already be committed when the run dies. The
+resumed run therefore deletes each batch's rows before rewriting them.
+
+LOAD_WORKERS=1, the default, writes in the calling process, with no pool.
+"""
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+import checkpoint
+import schemas
+
+LOAD_WORKERS = int(os.getenv("LOAD_WORKERS", "1"))
+BATCH_COLUMN = "load_batch"
+
+_engine = None   # per worker process
+
+
+def key_ranges(df: pd.DataFrame, key: str, max_rows: int, min_parts: int = 1) -> list:
+    """`df` sorted by `key` and cut into contiguous ranges of at most max_rows rows.
+
+    There are at least `min_parts` ranges (when there are that many rows), so
+    every worker gets one even when the input fits in a single batch.
+    """
+    if not len(df):
+        return []
+    parts = max(-(-len(df) // max_rows), min(min_parts, len(df)))
+    df = df.sort_values(key, kind="stable")
+    return [df.iloc[idx[0]:idx[-1] + 1] for idx in np.array_split(np.arange(len(df)), parts)]
+
+
+def create_staging(engine, schema: str, table: str, staging: str, stage: str = None):
+    """(Re)create the empty staging table.
+
+    With `stage`, its batch checkpoint is cleared in the same transaction: the
+    batches it counted were in the staging table just dropped.
+    """
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {schema}.{staging};"))
+        conn.execute(text(f"CREATE TABLE {schema}.{staging} (LIKE {schema}.{table} INCLUDING DEFAULTS);"))
+        conn.execute(text(f"ALTER TABLE {schema}.{staging} ADD COLUMN {BATCH_COLUMN} INT NOT NULL;"))
+        if stage:
+            checkpoint.clear_batches(conn, stage)
+
+
+def _write_batch(engine, schema: str, staging: str, source: str, columns: list,
+                 batch: int, df, replace: bool) -> int:
+    with engine.begin() as conn:
+        if replace:
+            conn.execute(text(f"DELETE FROM {schema}.{staging} WHERE {BATCH_COLUMN} = :b"), {"b": batch})
+        if df is not None and len(df):
+            out = schemas.for_sql(df, source)[columns].assign(**{BATCH_COLUMN: batch})
+            out.to_sql(staging, conn, schema=schema, if_exists="append", index=False)
+    return 0 if df is None else len(df)
+
+
+def _init_worker(url: str):
+    global _engine
+    _engine = create_engine(url, pool_size=1, max_overflow=0)
+
+
+def _worker_write(args) -> int:
+    return _write_batch(_engine, *args)
+
+
+def write(engine, schema: str, staging: str, source: str, columns: list, batches,
+          workers: int = None, first_batch: int = 1, replace: bool = False, on_progress=None) -> dict:
+    """Write `batches` (an iterable of frames) as batches first_batch, first_batch + 1, ...
+
+    on_progress(n) runs in this process each time batches up to n are all
+    committed. `replace` deletes a batch's old rows first (resumed runs).
+    Returns rows, batches, workers and seconds.
+    """
+    workers = max(1, workers or LOAD_WORKERS)
+    stats = {"rows": 0, "batches": 0, "workers": workers}
+    t0 = time.perf_counter()
+
+    if workers == 1:
+        for batch, df in enumerate(batches, start=first_batch):
+            stats["rows"] += _write_batch(engine, schema, staging, source, columns, batch, df, replace)
+            stats["batches"] += 1
+            if on_progress:
+                on_progress(batch)
+        stats["seconds"] = time.perf_counter() - t0
+        return stats
+
+    url = engine.url.render_as_string(hide_password=False)
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker, initargs=(url,)) as pool:
+        pending = deque()
+        batch_iter = enumerate(batches, start=first_batch)
+
+        def submit() -> bool:
+            item = next(batch_iter, None)
+            if item is None:
+                return False
+            batch, df = item
+            pending.append((batch, pool.submit(_worker_write, (schema, staging, source, columns, batch, df, replace))))
+            return True
+
+        # Two batches per worker in flight keeps every worker busy while
+        # bounding how many frames are held in memory.
+        while len(pending) < 2 * workers and submit():
+            pass
+        while pending:
+            batch, future = pending.popleft()
+            stats["rows"] += future.result()
+            stats["batches"] += 1
+            if on_progress:
+                on_progress(batch)
+            submit()
+
+    stats["seconds"] = time.perf_counter() - t0
+    return stats
+
+
+INDEXES_SQL = """
+SELECT i.relname AS name, pg_get_indexdef(i.oid) AS definition
+FROM pg_index x JOIN pg_class i ON i.oid = x.indexrelid
+WHERE x.indrelid = to_regclass(:table)
+ORDER BY 1
+"""
+
+CONSTRAINTS_SQL = """
+SELECT c.conname AS name, c.contype AS kind, pg_get_constraintdef(c.oid) AS definition,
+       i.relname AS index_name
+FROM pg_constraint c LEFT JOIN pg_class i ON i.oid = c.conindid
+WHERE c.conrelid = to_regclass(:table) AND c.contype IN ('p', 'u', 'f', 'c')
+ORDER BY c.contype = 'f', 1
+"""
+
+GRANTS_SQL = """
+SELECT grantee, privilege_type
+FROM information_schema.role_table_grants
+WHERE table_schema = :schema AND table_name = :table AND grantee <> current_user
+"""
+
+
+def _staged_index(name: str) -> str:
+    return f"{name}_load"
+
+
+def prepare_swap(engine, schema: str, table: str, staging: str) -> int:
+    """Build the live table's indexes on `staging` and analyze it. Returns its row count.
+
+    Safe to repeat after a crash: indexes already built are kept.
+    """
+    with engine.begin() as conn:
+        for name, definition in conn.execute(text(INDEXES_SQL), {"table": f"{schema}.{table}"}).all():
+            head, _, rest = definition.partition(f" ON {schema}.{table} ")
+            head = head.replace(f" INDEX {name}", f" INDEX IF NOT EXISTS {_staged_index(name)}", 1)
+            conn.execute(text(f"{head} ON {schema}.{staging} {rest}"))
+        conn.execute(text(f"ANALYZE {schema}.{staging}"))
+        return conn.execute(text(f"SELECT COUNT(*) FROM {schema}.{staging}")).scalar_one()
+
+
+def swap(conn, schema: str, table: str, staging: str):
+    """Replace `table` by `staging` (after prepare_swap), inside the caller's transaction."""
+    live = f"{schema}.{table}"
+    indexes = [name for name, _ in conn.execute(text(INDEXES_SQL), {"table": live}).all()]
+    constraints = conn.execute(text(CONSTRAINTS_SQL), {"table": live}).all()
+    grants = conn.execute(text(GRANTS_SQL), {"schema": schema, "table": table}).all()
+
+    conn.execute(text(f"ALTER TABLE {schema}.{staging} DROP COLUMN {BATCH_COLUMN};"))
+    conn.execute(text(f"DROP TABLE {live};"))
+    conn.execute(text(f"ALTER TABLE {schema}.{staging} RENAME TO {table};"))
+
+    backing = set()
+    for c in constraints:
+        if c.kind in ("p", "u") and c.index_name:
+            # USING INDEX also renames the index to the constraint's name.
+            kind = "PRIMARY KEY" if c.kind == "p" else "UNIQUE"
+            conn.execute(text(f"ALTER TABLE {live} ADD CONSTRAINT {c.name} "
+                              f"{kind} USING INDEX {_staged_index(c.index_name)};"))
+            backing.add(c.index_name)
+        else:
+            conn.execute(text(f"ALTER TABLE {live} ADD CONSTRAINT {c.name} {c.definition};"))
+    for name in indexes:
+        if name not in backing:
+            conn.execute(text(f"ALTER INDEX {schema}.{_staged_index(name)} RENAME TO {name};"))
+    for grantee, privilege in grants:
+        role = grantee if grantee == "PUBLIC" else f'"{grantee}"'
+        conn.execute(text(f"GRANT {privilege} ON {live} TO {role};"))
+
+
+def describe(stats: dict) -> str:
+    rate = stats["rows"] / stats["seconds"] if stats["seconds"] else 0.0
+    return (f"{stats['batches']} batches on {stats['workers']} worker(s) in {stats['seconds']:.2f}s "
+            f"({rate:,.0f} rows/s)")
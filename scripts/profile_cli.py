@@ -0,0 +1,25 @@
+"""`--profile` for the pipeline scripts. The profiler itself is src/api/profiling.py,
+imported only when a run is actually profiled."""
+import sys
+from pathlib import Path
+
+MODES = ["sample", "trace"]   # as profiling.MODES
+
+def add_argument(parser):
+    parser.add_argument(
+        "--profile", nargs="?", const="sample", choices=MODES, default=None,
+        help="Write a collapsed-stack profile to profiles/ (mode: sample, the default, or trace).",
+    )
+
+def run(stage: str, mode: str, params: dict, fn, /, *args, **kwargs):
+    """fn(*args, **kwargs), profiled when `mode` is set (fn may take its own `mode`)."""
+    if not mode:
+        return fn(*args, **kwargs)
+    api_dir = str(Path(__file__).resolve().parents[1] / "src" / "api")
+    if api_dir not in sys.path:
+        sys.path.insert(0, api_dir)
+    from profiling import Profile
+    with Profile(stage, params, mode) as p:
+        result = fn(*args, **kwargs)
+    print(f"🔥 Profile: {p.path}")
+    return result
@@ -1,28 +1,116 @@
 import os
+import io
 import sys
+import time
+import argparse
+import importlib
 import subprocess
 import logging
+from contextlib import redirect_stdout
 from pathlib import Path
 
-SCRIPTS = [
-    "scripts/load_products.py",
-    "scripts/load_customers.py",
-    "scripts/load_orders.py",
-    "scripts/load_returns.py",
-    "scripts/load_marketing.py",
+# (script, module, entry point). Modules are imported lazily so pandas/SQLAlchemy
+# are only paid for once, when the first stage actually runs.
+STAGES = [
+    ("scripts/load_products.py", "load_products", "load"),
+    ("scripts/load_customers.py", "load_customers", "load"),
+    ("scripts/load_orders.py", "load_orders", "load"),
+    ("scripts/load_returns.py", "load_returns", "load"),
+    ("scripts/build_sketches.py", "build_sketches", "load"),
+    # Merges late rows for archived months before customer_stats reads them.
+    ("scripts/archive_cold.py", "archive_cold", "load"),
+    ("scripts/build_customer_stats.py", "build_customer_stats", "load"),
+    ("scripts/load_marketing.py", "load_marketing", "load"),
 ]
 
-def run_one(script: str):
+VALIDATION = ("scripts/validate_data.py", "validate_data", "validate")
+
+# Raw files each stage reads. Together with the stage's own script they make
+# up the input hash that --resume compares. Stages pulling from SOURCE_API_URL
+# have no file to hash and always rerun.
+INPUTS = {
+    "load_products": ["data/raw/products_api.json"],
+    "load_customers": ["data/raw/customers.json"],
+    "load_orders": ["data/raw/orders_api.json"],
+    "load_returns": ["data/raw/returns.xlsx"],
+    "load_marketing": ["data/raw/marketing.csv"],
+}
+API_STAGES = {"load_products", "load_orders"}
+
+SCRIPTS = [script for script, _, _ in STAGES]
+
+def run_one(script: str, profile: str = None):
     logging.info("Running: %s", script)
-    result = subprocess.run([sys.executable, script], capture_output=True, text=True)
+    t0 = time.perf_counter()
+    cmd = [sys.executable, script]
+    if profile and script != VALIDATION[0]:
+        cmd += ["--profile", profile]
+    result = subprocess.run(cmd, capture_output=True, text=True)
     if result.returncode != 0:
         logging.error("FAILED: %s", script)
         logging.error("STDOUT:\n%s", result.stdout)
         logging.error("STDERR:\n%s", result.stderr)
         raise SystemExit(result.returncode)
-    logging.info("OK: %s\n%s", script, result.stdout.strip())
+    logging.info("OK: %s (%.2fs)\n%s", script, time.perf_counter() - t0, result.stdout.strip())
+    return None  # row counts aren't reported across processes
+
+def run_in_process(script: str, module: str, func: str, engine, profile: str = None, params: dict = None):
+    logging.info("Running: %s", script)
+    t0 = time.perf_counter()
+    entry = getattr(importlib.import_module(module), func)
+    t_import = time.perf_counter() - t0
+
+    out = io.StringIO()
+    try:
+        with redirect_stdout(out):
+            if profile:
+                # Imported only when asked for, so normal runs pay nothing
+                import profile_cli
+                rows = profile_cli.run(module, profile, params or {}, entry, engine)
+            else:
+                rows = entry(engine)
+    except Exception as e:
+        # KeyboardInterrupt and SystemExit propagate as they are, as in subprocess mode
+        logging.error("FAILED: %s", script)
+        logging.error("STDOUT:\n%s", out.getvalue())
+        logging.exception("ERROR: %s", e)
+        raise SystemExit(1)
+    logging.info(
+        "OK: %s (%.2fs, import %.2fs)\n%s",
+        script, time.perf_counter() - t0, t_import, out.getvalue().strip(),
+    )
+    return rows
+
+def stage_hash(script: str, module: str):
+    if module in API_STAGES and os.getenv("SOURCE_API_URL"):
+        return None
+    import checkpoint
+    try:
+        return checkpoint.input_hash([script] + INPUTS.get(module, []))
+    except FileNotFoundError:
+        return None  # the stage itself reports the missing file
 
 def main():
+    parser = argparse.ArgumentParser(description="Run the daily ETL pipeline.")
+    parser.add_argument(
+        "--subprocess",
+        action="store_true",
+        help="Run each stage in its own Python interpreter (old behaviour).",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skip stages that finished last run with unchanged inputs; restart from the first one that didn't.",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="sample",
+        choices=["sample", "trace"],
+        help="Write a collapsed-stack profile per stage to profiles/ (default mode: sample).",
+    )
+    args = parser.parse_args()
+
     Path("logs").mkdir(exist_ok=True)
     logging.basicConfig(
         level=logging.INFO,
@@ -41,15 +129,65 @@ def main():
     # If DATABASE_URL is not set, scripts will fall back to local .env values.
     logging.info("DATABASE_URL set: %s", bool(os.getenv("DATABASE_URL")))
 
-    for s in SCRIPTS:
+    for s in SCRIPTS + [VALIDATION[0]]:
         if not os.path.exists(s):
             logging.error("Missing script: %s", s)
             raise SystemExit(1)
-        run_one(s)
 
-    run_one("scripts/validate_data.py")
-    
+    t0 = time.perf_counter()
+    # Loader modules live next to this file; make them importable when the
+    # pipeline is started as `python scripts/run_pipeline.py` from anywhere.
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    from db import make_engine, bump_dataset_version
+    import checkpoint
+
+    engine = make_engine()
+    run_id = checkpoint.start_run(engine, args.resume)
+    previous = checkpoint.previous_stages(engine, run_id) if args.resume else {}
+    if args.resume:
+        # Lets batch-checkpointed stages continue, in-process and in subprocesses
+        os.environ["PIPELINE_RESUME"] = "1"
+    status = "failed"
+    try:
+        logging.info("Run: %s%s", run_id, " (resume)" if args.resume else "")
+        if args.subprocess:
+            logging.info("Mode: subprocess")
+        else:
+            logging.info("Mode: in-process")
+            logging.info("Startup (imports + engine): %.2fs", time.perf_counter() - t0)
+
+        restarted = not args.resume
+        for script, module, func in STAGES + [VALIDATION]:
+            input_hash = stage_hash(script, module)
+            prev_status, prev_hash, prev_rows, prev_finished = previous.get(module, (None,) * 4)
+            if not restarted and prev_status == "done" and input_hash is not None and prev_hash == input_hash:
+                logging.info("SKIP: %s (unchanged since %s, %s rows)", script, prev_finished, prev_rows)
+                checkpoint.record_stage(engine, run_id, module, "done", input_hash, prev_rows, prev_finished)
+                continue
+
+            # Everything from the first failed or invalidated stage on runs again
+            restarted = True
+            try:
+                if args.subprocess:
+                    rows = run_one(script, args.profile)
+                else:
+                    rows = run_in_process(script, module, func, engine, args.profile,
+                                          {"run_id": run_id, "resume": args.resume})
+            except SystemExit:
+                checkpoint.record_stage(engine, run_id, module, "failed", input_hash)
+                raise
+            checkpoint.record_stage(engine, run_id, module, "done", input_hash, rows)
+
+        if restarted:
+            logging.info("Dataset version: %s", bump_dataset_version(engine))
+        else:
+            logging.info("Nothing to resume: every stage is up to date.")
+        status = "done"
+    finally:
+        checkpoint.finish_run(engine, run_id, status)
+        engine.dispose()
 
+    logging.info("Total: %.2fs", time.perf_counter() - t0)
     logging.info("✅ Pipeline complete.")
 
 if __name__ == "__main__":
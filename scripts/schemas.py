@@ -0,0 +1,174 @@
+"""Column schemas for the five raw sources.
+
+Every loader parses through `parse()` instead of hand-written cleaning:
+  - timestamps/dates use an explicit strptime format (no per-value inference),
+  - integers are downcast to the declared width (out-of-range values raise),
+  - money is fixed-point: int64 cents in memory, converted back to decimal
+    euros only when written (`for_sql()`),
+  - low-cardinality strings become pandas categoricals.
+
+`parse_source()` also reports parse time, in-memory size and peak RSS growth
+for each source (PARSE_STATS=0 turns the report off).
+"""
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+PARSE_STATS = os.getenv("PARSE_STATS", "1") == "1"
+
+ISO_SECONDS = "%Y-%m-%dT%H:%M:%S"
+
+
+def integer(dtype: str) -> dict:
+    return {"kind": "int", "dtype": dtype}
+
+def timestamp(fmt: str = ISO_SECONDS) -> dict:
+    return {"kind": "timestamp", "format": fmt}
+
+def day(fmt: str = "%Y-%m-%d") -> dict:
+    return {"kind": "date", "format": fmt}
+
+def money() -> dict:
+    return {"kind": "money"}
+
+def category() -> dict:
+    return {"kind": "category"}
+
+def text() -> dict:
+    return {"kind": "text"}
+
+def boolean() -> dict:
+    return {"kind": "bool"}
+
+
+SCHEMAS = {
+    "products": {
+        "product_id": integer("int32"),
+        "name": text(),
+        "category": category(),
+        "price": money(),
+        "is_active": boolean(),
+        "updated_at": timestamp(),
+    },
+    "customers": {
+        "customer_id": integer("int32"),
+        "full_name": text(),
+        "email": text(),
+        "country": category(),
+        "segment": category(),
+        "created_at": timestamp(),
+    },
+    "orders": {
+        "order_line_id": integer("int64"),
+        "order_id": integer("int64"),
+        "order_timestamp": timestamp(),
+        "customer_id": integer("int32"),
+        "product_id": integer("int32"),
+        "qty": integer("int16"),
+        "gross_revenue": money(),
+        "discount_amount": money(),
+        "net_revenue": money(),
+        "currency": category(),
+    },
+    "returns": {
+        "order_line_id": integer("int64"),
+        "order_id": integer("int64"),
+        "customer_id": integer("int32"),
+        "product_id": integer("int32"),
+        "order_timestamp": timestamp(),
+        "refund_timestamp": timestamp(),
+        "refund_amount": money(),
+        "reason": category(),
+    },
+    "marketing": {
+        "date": day(),
+        "channel": category(),
+        "spend_eur": money(),
+    },
+}
+
+
+def _parse_column(s: pd.Series, spec: dict, name: str) -> pd.Series:
+    kind = spec["kind"]
+    if kind == "int":
+        values = pd.to_numeric(s, errors="raise")
+        info = np.iinfo(spec["dtype"])
+        if len(values) and (values.min() < info.min or values.max() > info.max):
+            raise ValueError(f"{name}: values outside {spec['dtype']}")
+        return values.astype(spec["dtype"])
+    if kind == "timestamp":
+        if pd.api.types.is_datetime64_any_dtype(s):  # Excel cells arrive typed
+            return s
+        return pd.to_datetime(s, format=spec["format"])
+    if kind == "date":
+        return pd.to_datetime(s, format=spec["format"])  # datetime64 until written
+    if kind == "money":
+        return (pd.to_numeric(s, errors="raise") * 100).round().astype("int64")
+    if kind == "category":
+        return s.astype("category")
+    if kind == "bool":
+        return s.astype(bool)
+    return s
+
+
+def parse(df: pd.DataFrame, source: str) -> pd.DataFrame:
+    """Typed copy of `df` with exactly the schema's columns, in schema order."""
+    schema = SCHEMAS[source]
+    return pd.DataFrame({name: _parse_column(df[name], spec, name) for name, spec in schema.items()})
+
+
+def for_sql(df: pd.DataFrame, source: str) -> pd.DataFrame:
+    """Money back to euros and dates back to date values for writing."""
+    out = df.copy()
+    for name, spec in SCHEMAS[source].items():
+        if name in out and spec["kind"] == "money":
+            out[name] = out[name] / 100
+        elif name in out and spec["kind"] == "date":
+            out[name] = out[name].dt.date
+    return out
+
+
+def _rss_mb(field: str):
+    """VmRSS / VmHWM of this process in MB, or None where /proc isn't available."""
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def _reset_peak():
+    # Writing 5 to clear_refs resets VmHWM (Linux), so the peak below is this parse's.
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="ascii") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def parse_source(source: str, read) -> pd.DataFrame:
+    """Read a raw frame with `read()`, parse it, and print time and peak memory."""
+    if not PARSE_STATS:
+        return parse(read(), source)
+
+    rss_before = _rss_mb("VmRSS")
+    _reset_peak()
+    t0 = time.perf_counter()
+    raw = read()
+    df = parse(raw, source)
+    elapsed = time.perf_counter() - t0
+    peak = _rss_mb("VmHWM")
+
+    raw_mb = raw.memory_usage(deep=True).sum() / 1e6
+    typed_mb = df.memory_usage(deep=True).sum() / 1e6
+    peak_note = f", peak RSS +{peak - rss_before:.1f} MB" if peak is not None and rss_before is not None else ""
+    print(
+        f"📐 Parsed {len(df)} {source} rows in {elapsed:.2f}s: "
+        f"{typed_mb:.2f} MB typed (raw frame {raw_mb:.2f} MB){peak_note}"
+    )
+    return df
@@ -0,0 +1,89 @@
+"""Local stand-in for the orders and products source APIs.
+
+Serves data/raw/orders_api.json and products_api.json (the generator's
+output) page by page, in the same envelope, so extract_api.py can be run
+offline:
+    python scripts/source_api_server.py --port 5100 --fail-rate 0.1 --latency 0.05
+    SOURCE_API_URL=http://localhost:5100 python scripts/run_pipeline.py
+
+GET /orders?page=1&page_size=1000&since=2025-07-01T00:00:00
+GET /products?page=1&page_size=1000&since=...
+"""
+import json
+import time
+import random
+import argparse
+from datetime import datetime
+
+from flask import Flask, jsonify, request
+
+RAW_DIR = "data/raw"
+
+# resource -> (file, cursor field, key)
+RESOURCES = {
+    "orders": ("orders_api.json", "order_timestamp", "order_line_id"),
+    "products": ("products_api.json", "updated_at", "product_id"),
+}
+
+app = Flask(__name__)
+settings = {"fail_rate": 0.0, "latency": 0.0}
+_data = {}
+
+
+def records(resource: str):
+    """(payload, rows sorted by cursor then key), read once."""
+    if resource not in _data:
+        filename, cursor, key = RESOURCES[resource]
+        with open(f"{RAW_DIR}/{filename}", "r", encoding="utf-8") as f:
+            payload = json.load(f)
+        rows = sorted(payload.pop("data"), key=lambda r: (datetime.fromisoformat(r[cursor]), r[key]))
+        _data[resource] = (payload, rows)
+    return _data[resource]
+
+
+@app.get("/<resource>")
+def page(resource):
+    if resource not in RESOURCES:
+        return jsonify({"error": f"Unknown resource. Use one of: {', '.join(RESOURCES)}"}), 404
+    if settings["latency"]:
+        time.sleep(settings["latency"])
+    if random.random() < settings["fail_rate"]:
+        return jsonify({"error": "Simulated outage"}), 503
+
+    try:
+        page_no = int(request.args.get("page", 1))
+        page_size = int(request.args.get("page_size", 1000))
+        since = request.args.get("since")
+        since = datetime.fromisoformat(since) if since else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    payload, rows = records(resource)
+    if since is not None:
+        cursor = RESOURCES[resource][1]
+        rows = [r for r in rows if datetime.fromisoformat(r[cursor]) >= since]
+
+    total_pages = max(1, -(-len(rows) // page_size))
+    start = (page_no - 1) * page_size
+    return jsonify({
+        **payload,
+        "data": rows[start:start + page_size],
+        "page": page_no,
+        "page_size": page_size,
+        "total": len(rows),
+        "total_pages": total_pages,
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve data/raw as a paginated source API.")
+    parser.add_argument("--port", type=int, default=5100)
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Share of requests answered with 503.")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to each request.")
+    args = parser.parse_args()
+    settings.update(fail_rate=args.fail_rate, latency=args.latency)
+    app.run(port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,6 @@
-import os
-from sqlalchemy import create_engine, text
-from dotenv import load_dotenv
+from sqlalchemy import text
 
-load_dotenv()
-
-DB_HOST = os.getenv("DB_HOST", "localhost")
-DB_PORT = os.getenv("DB_PORT", "5432")
-DB_NAME = os.getenv("DB_NAME", "demo_dw")
-DB_USER = os.getenv("DB_USER", "demo_user")
-DB_PASSWORD = os.getenv("DB_PASSWORD", "demo_pass")
-
-DATABASE_URL = os.getenv("DATABASE_URL")
-
-def make_engine():
-    if DATABASE_URL:
-        return create_engine(DATABASE_URL)
-    return create_engine(
-        f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-    )
+from db import make_engine
 
 # Each check returns a number.
 # - "min" means it must be >= expected
@@ -57,8 +40,7 @@ def check_ok(kind: str, expected: int, value: int) -> bool:
         return value == expected
     return False
 
-def main():
-    engine = make_engine()
+def validate(engine) -> int:
     failures = []
 
     with engine.begin() as conn:
@@ -73,6 +55,10 @@ def main():
         raise SystemExit(f"❌ Validation failed: {failures}")
 
     print("✅ All validation checks passed.")
+    return len(CHECKS)
+
+def main():
+    validate(make_engine())
 
 if __name__ == "__main__":
     main()
@@ -1,12 +1,26 @@
 import os
-from datetime import datetime, date
-
-from flask import Flask, jsonify, request
+import json
+import time as clock
+import base64
+from functools import wraps
+from datetime import datetime, date, time, timedelta
+
+import pyarrow as pa
+import pyarrow.compute as pc
+from flask import Flask, jsonify, request, Response, stream_with_context, make_response, g
 from sqlalchemy import create_engine, text
 from dotenv import load_dotenv
 from decimal import Decimal
 import traceback
 from werkzeug.exceptions import HTTPException
+from sqlalchemy.exc import ProgrammingError
+
+from coalesce import single_flight
+import compression
+from replicas import ReadRouter
+from columnar import ColumnarStore
+import sketches
+import archive
 
 load_dotenv()
 
@@ -24,10 +38,39 @@ else:
     engine = create_engine(
         f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
     )
-   
+
+# `engine` is the primary. Analytical reads go through the router so they can
+# be served by replicas listed in DATABASE_READ_URLS.
+router = ReadRouter(
+    engine,
+    [u.strip() for u in os.getenv("DATABASE_READ_URLS", "").split(",") if u.strip()],
+)
 
 app = Flask(__name__)
 
+EXPORT_DEFAULT_LIMIT = 1000
+EXPORT_MAX_LIMIT = 10000
+EXPORT_FETCH_SIZE = 500
+
+# ANALYTICS_ENGINE=memory answers the analytics endpoints from in-process
+# NumPy columns (see columnar.py) instead of querying Postgres.
+ANALYTICS_ENGINE = os.getenv("ANALYTICS_ENGINE", "sql")
+
+# How long the API trusts its last read of public.dataset_version.
+DATASET_VERSION_TTL = float(os.getenv("DATASET_VERSION_TTL", "5"))
+_dataset_version = {"value": 0, "checked": 0.0}
+
+# Time buckets for the time-series endpoints, finest first.
+GRANULARITIES = ["hour", "day", "week", "month"]
+
+# API_PROFILING=1 lets a request ask for a profile with ?profile=sample|trace
+# or an X-Profile header (see profiling.py). Off by default, and then no
+# profiling hooks are registered at all.
+API_PROFILING = os.getenv("API_PROFILING", "0") == "1"
+
+columnar = ColumnarStore(router.engine_for) if ANALYTICS_ENGINE == "memory" else None
+if columnar is not None:
+    columnar.refresh_async(0)
 
 
 def clean_json(obj):
@@ -50,6 +93,183 @@ def parse_date(s: str) -> date:
         raise ValueError("Invalid date format. Use YYYY-MM-DD")
 
 
+def encode_cursor(ts: datetime, line_id: int) -> str:
+    raw = json.dumps([ts.isoformat(), int(line_id)]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(token: str):
+    try:
+        ts_str, line_id = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+        return datetime.fromisoformat(ts_str), int(line_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor token")
+
+
+def dataset_version() -> int:
+    """Latest pipeline run id (0 before the first run), re-read at most every DATASET_VERSION_TTL s."""
+    now = clock.monotonic()
+    if now - _dataset_version["checked"] >= DATASET_VERSION_TTL:
+        try:
+            with engine.connect() as conn:
+                value = conn.execute(text("SELECT MAX(version) FROM public.dataset_version")).scalar()
+        except ProgrammingError:
+            value = None
+        _dataset_version.update(value=value or 0, checked=now)
+    return _dataset_version["value"]
+
+
+def read_engine():
+    """Engine for analytical reads, never behind the current dataset version."""
+    return router.engine_for(dataset_version())
+
+
+def archive_engine(start, stages: bool = True):
+    """Engine for a read over a range starting at `start`, plus the archive boundary.
+
+    Ranges that reach archived months stage archived aggregates in temp tables
+    (archive.stage), which replicas can't create, so they run on the primary.
+    Pass stages=False for reads answered from the rollups alone.
+    """
+    reader = read_engine()
+    with reader.connect() as conn:
+        boundary = archive.boundary(conn)
+    return (engine if stages and archive.reaches(boundary, start) else reader), boundary
+
+
+def wants_approx() -> bool:
+    """approx=true serves distinct counts from HyperLogLog sketches (see hll.py)."""
+    return request.args.get("approx", "").lower() in ("1", "true", "yes")
+
+
+def approx_fields() -> dict:
+    return {"approx": True, "error_pct": sketches.ERROR_PCT} if wants_approx() else {}
+
+
+def memory_snapshot():
+    """Current in-memory snapshot, or None to use SQL (mode off, or still loading)."""
+    if columnar is None:
+        return None
+    return columnar.get(dataset_version())
+
+
+def coalesced(view):
+    """Share one execution between concurrent identical requests.
+
+    The key is the path, the sorted query string and the dataset version, so
+    a new pipeline run never gets answered with results from the old data.
+    The shared result is the uncompressed body. Each response is then
+    compressed for its own Accept-Encoding through compression.compress_cached,
+    which keeps one compressed copy per (key, encoding): followers and repeat
+    requests reuse it instead of compressing again.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if "profile" in g:
+            # A profiled request must do the work itself, not wait on another one
+            return view(*args, **kwargs)
+        key = json.dumps([request.path, sorted(request.args.items(multi=True)), dataset_version()])
+
+        def run():
+            resp = make_response(view(*args, **kwargs))
+            return [resp.get_data(as_text=True), resp.status_code, resp.mimetype]
+
+        body, status, mimetype = single_flight(key, run)
+        resp = Response(body, status=status, mimetype=mimetype)
+        encoding = compression.negotiate(request.headers.get("Accept-Encoding", ""))
+        data = resp.get_data()
+        if encoding and status == 200 and len(data) >= compression.COMPRESS_MIN_SIZE:
+            resp.set_data(compression.compress_cached(key, data, encoding))
+            resp.headers["Content-Encoding"] = encoding
+        return resp
+    return wrapper
+
+
+def bucket_expr(col: str, granularity: str) -> str:
+    """SQL expression truncating `col` to a bucket start (granularity is whitelisted)."""
+    if granularity == "hour":
+        return f"date_trunc('hour', {col})"
+    if granularity == "day":
+        return f"{col}::date"
+    return f"date_trunc('{granularity}', {col})::date"
+
+
+def bucket_count(start: date, end: date, granularity: str) -> int:
+    days = (end - start).days + 1
+    if granularity == "hour":
+        return days * 24
+    if granularity == "day":
+        return days
+    if granularity == "week":
+        first = start - timedelta(days=start.weekday())
+        last = end - timedelta(days=end.weekday())
+        return (last - first).days // 7 + 1
+    return (end.year - start.year) * 12 + end.month - start.month + 1
+
+
+def series_options(start: date, end: date, allowed: list):
+    """Read granularity/max_points from the query string.
+
+    Without either, the series stays daily. With only max_points, the finest
+    allowed granularity that fits is picked.
+    """
+    granularity = request.args.get("granularity")
+    max_points = request.args.get("max_points")
+
+    if granularity is not None and granularity not in allowed:
+        raise ValueError(f"Invalid granularity. Use one of: {', '.join(allowed)}")
+    if max_points is not None:
+        max_points = int(max_points)
+        if max_points < 3:
+            raise ValueError("max_points must be at least 3")
+
+    if granularity is None:
+        granularity = "day"
+        if max_points is not None:
+            fitting = [g for g in allowed if bucket_count(start, end, g) <= max_points]
+            granularity = fitting[0] if fitting else allowed[-1]
+    return granularity, max_points
+
+
+def lttb(rows: list, x_key: str, y_key: str, threshold: int) -> list:
+    """Largest-Triangle-Three-Buckets downsampling.
+
+    Keeps the first and last rows and, for each bucket in between, the row
+    forming the largest triangle with its neighbours, so peaks and dips
+    survive where plain averaging would flatten them.
+    """
+    n = len(rows)
+    if threshold >= n or threshold < 3:
+        return rows
+
+    def as_x(v):
+        return v.timestamp() if isinstance(v, datetime) else v.toordinal()
+
+    xs = [as_x(r[x_key]) for r in rows]
+    ys = [float(r[y_key] or 0) for r in rows]
+    every = (n - 2) / (threshold - 2)
+
+    out = [rows[0]]
+    a = 0
+    for i in range(threshold - 2):
+        lo = int(i * every) + 1
+        hi = int((i + 1) * every) + 1
+        next_lo = hi
+        next_hi = min(int((i + 2) * every) + 1, n)
+        avg_x = sum(xs[next_lo:next_hi]) / (next_hi - next_lo)
+        avg_y = sum(ys[next_lo:next_hi]) / (next_hi - next_lo)
+
+        best, best_area = lo, -1.0
+        for j in range(lo, hi):
+            area = abs((xs[a] - avg_x) * (ys[j] - ys[a]) - (xs[a] - xs[j]) * (avg_y - ys[a]))
+            if area > best_area:
+                best, best_area = j, area
+        out.append(rows[best])
+        a = best
+    out.append(rows[-1])
+    return out
+
+
 @app.errorhandler(Exception)
 def handle_exception(e):
     # Keep HTTP errors (like 404) as their real status codes
@@ -62,9 +282,52 @@ def handle_exception(e):
 
 
 
+@app.after_request
+def compress_response(resp):
+    # Coalesced views arrive already compressed (from the per-key cache);
+    # this covers the rest, including the streamed export.
+    return compression.apply(resp, request.headers.get("Accept-Encoding", ""))
+
+
+if API_PROFILING:
+    import profiling
+
+    @app.before_request
+    def start_profile():
+        mode = request.args.get("profile") or request.headers.get("X-Profile")
+        if not mode:
+            return None
+        try:
+            g.profile = profiling.Profile(request.path, request.args.to_dict(), mode)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        g.profile.__enter__()
+        return None
+
+    @app.after_request
+    def stop_profile(resp):
+        # Streamed bodies are produced after this point, so only their setup is profiled
+        p = g.pop("profile", None)
+        if p is not None:
+            p.__exit__(None, None, None)
+            resp.headers["X-Profile-File"] = p.path
+        return resp
+
+    @app.teardown_request
+    def abandon_profile(exc):
+        p = g.pop("profile", None)
+        if p is not None:
+            p.__exit__(None, None, None)
+
+
 @app.get("/health")
 def health():
-    return jsonify({"status": "ok"})
+    # The dashboard drops its local day cache when the dataset version moves.
+    try:
+        version = dataset_version()
+    except Exception:
+        version = None
+    return jsonify({"status": "ok", "dataset_version": version})
 
 @app.get("/")
 def home():
@@ -72,16 +335,20 @@ def home():
         "service": "demo-dw API",
         "endpoints": [
             "/health",
-            "/kpis?start=YYYY-MM-DD&end=YYYY-MM-DD",
-            "/revenue/by-day?start=YYYY-MM-DD&end=YYYY-MM-DD",
+            "/kpis?start=YYYY-MM-DD&end=YYYY-MM-DD&approx=false",
+            "/revenue/by-day?start=YYYY-MM-DD&end=YYYY-MM-DD&granularity=day&max_points=500",
             "/revenue/by-category?start=YYYY-MM-DD&end=YYYY-MM-DD",
             "/top-products?start=YYYY-MM-DD&end=YYYY-MM-DD&limit=10",
-            "/marketing/roas-by-day?start=YYYY-MM-DD&end=YYYY-MM-DD",
+            "/marketing/roas-by-day?start=YYYY-MM-DD&end=YYYY-MM-DD&granularity=day&max_points=500",
+            "/export/order-lines?start=YYYY-MM-DD&end=YYYY-MM-DD&limit=1000&cursor=TOKEN",
+            "/customers/top?limit=10&by=lifetime_value",
+            "/customers/breakdown?by=country",
         ]
     })
 
 
 @app.get("/kpis")
+@coalesced
 def kpis():
     # Read query params like /kpis?start=2025-01-01&end=2025-01-31
     start_str = request.args.get("start")
@@ -96,7 +363,7 @@ def kpis():
     except ValueError as e:
             return jsonify({"error": str(e)}), 400
 
-    sql = text("""
+    sql = """
         WITH base AS (
           SELECT
             ol.order_id,
@@ -104,7 +371,7 @@ def kpis():
             ol.net_revenue,
             ol.order_timestamp::date AS order_date
           FROM public.order_lines ol
-          WHERE ol.order_timestamp::date BETWEEN :start AND :end
+          WHERE ol.order_timestamp >= :start AND ol.order_timestamp < CAST(:end AS date) + 1
         ),
         refunds AS (
           SELECT
@@ -135,19 +402,85 @@ def kpis():
           ) AS aov
         FROM base
         LEFT JOIN refunds ON refunds.order_line_id = base.order_line_id;
-    """)
+    """
 
-    with engine.begin() as conn:
-        row = conn.execute(sql, {"start": start, "end": end}).mappings().one()
+    # Ranges reaching archived months: sums and line counts of archived days
+    # come from the daily rollup; distinct orders count the hot order ids
+    # together with the archived ones staged in {orders}, since an order's
+    # lines can fall on both sides of the boundary.
+    tiered_sql = """
+        WITH base AS (
+          SELECT ol.order_id, ol.order_line_id, ol.net_revenue
+          FROM {lines} ol
+          WHERE ol.order_timestamp >= :start AND ol.order_timestamp < CAST(:end AS date) + 1
+        ),
+        hot AS (
+          SELECT
+            COALESCE(SUM(base.net_revenue), 0) AS revenue_net,
+            COALESCE(SUM(COALESCE(r.refund_amount, 0)), 0) AS refunds_total,
+            COUNT(base.order_line_id) AS order_lines,
+            COUNT(r.order_line_id) AS refunded_lines
+          FROM base
+          LEFT JOIN public.returns r ON r.order_line_id = base.order_line_id
+        ),
+        cold AS (
+          SELECT
+            COALESCE(SUM(ad.revenue_net), 0) AS revenue_net,
+            COALESCE(SUM(ad.refunds_total), 0) AS refunds_total,
+            COALESCE(SUM(ad.order_lines), 0) AS order_lines,
+            COALESCE(SUM(ad.refunded_lines), 0) AS refunded_lines
+          FROM public.archive_daily ad
+          WHERE ad.day BETWEEN :start AND :end
+        ),
+        totals AS (
+          SELECT
+            hot.revenue_net + cold.revenue_net AS revenue_net,
+            hot.refunds_total + cold.refunds_total AS refunds_total,
+            (hot.order_lines + cold.order_lines)::bigint AS order_lines,
+            hot.refunded_lines + cold.refunded_lines AS refunded_lines,
+            (SELECT COUNT(DISTINCT order_id)
+             FROM (SELECT order_id FROM base UNION ALL SELECT order_id FROM {orders}) o) AS orders
+          FROM hot, cold
+        )
+        SELECT
+          revenue_net,
+          refunds_total,
+          revenue_net - refunds_total AS revenue_after_refunds,
+          orders,
+          order_lines,
+          ROUND(100.0 * refunded_lines / NULLIF(order_lines, 0), 2) AS refund_rate_pct,
+          ROUND((revenue_net / NULLIF(orders, 0))::numeric, 2) AS aov
+        FROM totals;
+    """
+
+    snap = memory_snapshot()
+    if wants_approx():
+        with read_engine().begin() as conn:
+            row = sketches.kpis(conn, start, end)
+    elif snap is not None:
+        row = snap.kpis(start, end)
+    else:
+        reader, boundary = archive_engine(start)
+        with reader.begin() as conn:
+            params = {"start": start, "end": end}
+            if archive.reaches(boundary, start):
+                ids = archive.scan(conn, "order_lines", ["order_id", "order_timestamp"], boundary, start, end)
+                orders = archive.stage(conn, "archived_orders", pa.table({"order_id": pc.unique(ids["order_id"])}))
+                query = tiered_sql.format(lines=archive.hot("order_lines", params, boundary), orders=orders)
+            else:
+                query = sql
+            row = conn.execute(text(query), params).mappings().one()
 
     return jsonify(clean_json({
     "start": start_str,
     "end": end_str,
+    **approx_fields(),
     "kpis": dict(row)
 }))
 
 
 @app.get("/revenue/by-day")
+@coalesced
 def revenue_by_day():
     start_str = request.args.get("start")
     end_str = request.args.get("end")
@@ -157,31 +490,111 @@ def revenue_by_day():
     try:
        start = parse_date(start_str)
        end = parse_date(end_str)
+       # Sketches are per day, so approx=true can't go finer than that.
+       granularity, max_points = series_options(start, end, GRANULARITIES[1:] if wants_approx() else GRANULARITIES)
     except ValueError as e:
             return jsonify({"error": str(e)}), 400
 
-    sql = text("""
+    sql = f"""
         SELECT
-          ol.order_timestamp::date AS day,
+          {bucket_expr("ol.order_timestamp", granularity)} AS day,
           ROUND(SUM(ol.net_revenue)::numeric, 2) AS revenue_net,
-          COUNT(DISTINCT ol.order_id) AS orders
+          COUNT(DISTINCT ol.order_id) AS orders,
+          -- line counts as in the /kpis join, so refund rates add up across buckets
+          SUM(COALESCE(r.refunds, 1))::bigint AS order_lines,
+          COALESCE(SUM(r.refunds), 0)::bigint AS refunded_lines
         FROM public.order_lines ol
-        WHERE ol.order_timestamp::date BETWEEN :start AND :end
+        LEFT JOIN (SELECT order_line_id, COUNT(*) AS refunds FROM public.returns GROUP BY 1) r
+          ON r.order_line_id = ol.order_line_id
+        WHERE ol.order_timestamp >= :start AND ol.order_timestamp < CAST(:end AS date) + 1
         GROUP BY 1
         ORDER BY 1;
-    """)
+    """
 
-    with engine.begin() as conn:
-        rows = conn.execute(sql, {"start": start, "end": end}).mappings().all()
+    # Other buckets over archived months: archived lines are summed per bucket
+    # and order in pyarrow and staged in {archived}, so orders that have lines
+    # on both sides of the boundary are still counted once per bucket.
+    tiered_sql = f"""
+        SELECT
+          day,
+          ROUND(SUM(revenue_net)::numeric, 2) AS revenue_net,
+          COUNT(DISTINCT order_id) AS orders,
+          SUM(order_lines)::bigint AS order_lines,
+          SUM(refunded_lines)::bigint AS refunded_lines
+        FROM (
+          SELECT
+            {bucket_expr("ol.order_timestamp", granularity)} AS day,
+            ol.order_id,
+            ol.net_revenue AS revenue_net,
+            COALESCE(r.refunds, 1) AS order_lines,
+            COALESCE(r.refunds, 0) AS refunded_lines
+          FROM {{lines}} ol
+          LEFT JOIN (SELECT order_line_id, COUNT(*) AS refunds FROM public.returns GROUP BY 1) r
+            ON r.order_line_id = ol.order_line_id
+          WHERE ol.order_timestamp >= :start AND ol.order_timestamp < CAST(:end AS date) + 1
+          UNION ALL
+          SELECT day, order_id, revenue_net, order_lines, refunded_lines FROM {{archived}}
+        ) t
+        GROUP BY 1
+        ORDER BY 1;
+    """
+
+    # Daily buckets over archived months come straight from the daily rollup.
+    daily_sql = """
+        SELECT d.day, ROUND(d.revenue_net::numeric, 2) AS revenue_net, d.orders, d.order_lines, d.refunded_lines
+        FROM {days} d
+        ORDER BY 1;
+    """
+
+    snap = memory_snapshot()
+    if wants_approx():
+        with read_engine().begin() as conn:
+            data = sketches.revenue_by_bucket(conn, start, end, bucket_expr("sd.day", granularity))
+    elif snap is not None:
+        data = snap.revenue_by_day(start, end, granularity)
+    else:
+        reader, boundary = archive_engine(start, stages=granularity != "day")
+        with reader.begin() as conn:
+            params = {"start": start, "end": end}
+            if not archive.reaches(boundary, start):
+                query = sql
+            elif granularity == "day":
+                query = daily_sql.format(days=archive.daily(params, boundary))
+            else:
+                lines = archive.scan(conn, "order_lines", ["order_id", "order_line_id", "net_revenue", "order_timestamp"],
+                                     boundary, start, end)
+                returns = archive.scan(conn, "returns", ["order_line_id", "refund_amount"], boundary, start, end)
+                lines = lines.join(archive.refunds_by_line(returns), "order_line_id", join_type="left outer")
+                per_order = pa.table({
+                    "day": archive.bucket(lines["order_timestamp"], granularity),
+                    "order_id": lines["order_id"],
+                    "revenue_net": lines["net_revenue"],
+                    "order_lines": pc.fill_null(lines["refunds"], 1),
+                    "refunded_lines": pc.fill_null(lines["refunds"], 0),
+                }).group_by(["day", "order_id"]).aggregate(
+                    [("revenue_net", "sum"), ("order_lines", "sum"), ("refunded_lines", "sum")])
+                per_order = per_order.rename_columns(
+                    {"revenue_net_sum": "revenue_net", "order_lines_sum": "order_lines", "refunded_lines_sum": "refunded_lines"})
+                query = tiered_sql.format(lines=archive.hot("order_lines", params, boundary),
+                                          archived=archive.stage(conn, "archived_buckets", per_order))
+            data = [dict(r) for r in conn.execute(text(query), params).mappings().all()]
+
+    downsampled = bool(max_points) and len(data) > max_points
+    if downsampled:
+        data = lttb(data, "day", "revenue_net", max_points)
 
     return jsonify(clean_json({
     "start": start_str,
     "end": end_str,
-    "data": [dict(r) for r in rows]
+    "granularity": granularity,
+    "downsampled": downsampled,
+    **approx_fields(),
+    "data": data
 }))
 
 
 @app.get("/revenue/by-category")
+@coalesced
 def revenue_by_category():
     start_str = request.args.get("start")
     end_str = request.args.get("end")
@@ -194,28 +607,66 @@ def revenue_by_category():
     except ValueError as e:
             return jsonify({"error": str(e)}), 400
 
-    sql = text("""
+    sql = """
         SELECT
           p.category,
           ROUND(SUM(ol.net_revenue)::numeric, 2) AS revenue_net,
           COUNT(DISTINCT ol.order_id) AS orders
         FROM public.order_lines ol
         JOIN public.products p ON p.product_id = ol.product_id
-        WHERE ol.order_timestamp::date BETWEEN :start AND :end
+        WHERE ol.order_timestamp >= :start AND ol.order_timestamp < CAST(:end AS date) + 1
         GROUP BY 1
         ORDER BY revenue_net DESC;
-    """)
+    """
 
-    with engine.begin() as conn:
-        rows = conn.execute(sql, {"start": start, "end": end}).mappings().all()
+    # Ranges reaching archived months: archived lines summed per product and
+    # order in pyarrow, staged in {archived} and counted with the hot lines.
+    tiered_sql = """
+        SELECT
+          p.category,
+          ROUND(SUM(t.revenue_net)::numeric, 2) AS revenue_net,
+          COUNT(DISTINCT t.order_id) AS orders
+        FROM (
+          SELECT ol.product_id, ol.order_id, ol.net_revenue AS revenue_net
+          FROM {lines} ol
+          WHERE ol.order_timestamp >= :start AND ol.order_timestamp < CAST(:end AS date) + 1
+          UNION ALL
+          SELECT product_id, order_id, revenue_net FROM {archived}
+        ) t
+        JOIN public.products p ON p.product_id = t.product_id
+        GROUP BY 1
+        ORDER BY revenue_net DESC;
+    """
+
+    snap = memory_snapshot()
+    if wants_approx():
+        with read_engine().begin() as conn:
+            data = sketches.revenue_by_category(conn, start, end)
+    elif snap is not None:
+        data = snap.revenue_by_category(start, end)
+    else:
+        reader, boundary = archive_engine(start)
+        with reader.begin() as conn:
+            params = {"start": start, "end": end}
+            query = sql
+            if archive.reaches(boundary, start):
+                lines = archive.scan(conn, "order_lines", ["order_id", "product_id", "net_revenue", "order_timestamp"],
+                                     boundary, start, end)
+                per_order = lines.group_by(["product_id", "order_id"]).aggregate([("net_revenue", "sum")])
+                per_order = per_order.rename_columns({"net_revenue_sum": "revenue_net"})
+                query = tiered_sql.format(lines=archive.hot("order_lines", params, boundary),
+                                          archived=archive.stage(conn, "archived_orders", per_order))
+            data = [dict(r) for r in conn.execute(text(query), params).mappings().all()]
 
     return jsonify(clean_json({
     "start": start_str,
     "end": end_str,
-    "data": [dict(r) for r in rows]
+    **approx_fields(),
+    "data": data
 }))
 
 @app.get("/top-products")
+@coalesced
 def top_products():
     start_str = request.args.get("start")
     end_str = request.args.get("end")
@@ -239,23 +690,47 @@ def top_products():
           ROUND(SUM(ol.net_revenue)::numeric, 2) AS revenue_net
         FROM public.order_lines ol
         JOIN public.products p ON p.product_id = ol.product_id
-        WHERE ol.order_timestamp::date BETWEEN :start AND :end
+        WHERE ol.order_timestamp >= :start AND ol.order_timestamp < CAST(:end AS date) + 1
         GROUP BY 1,2,3
         ORDER BY revenue_net DESC
         LIMIT :limit;
     """)
 
-    with engine.begin() as conn:
-        rows = conn.execute(sql, {"start": start, "end": end, "limit": limit}).mappings().all()
+    # Archived months are summed from the per-product daily rollup.
+    archived_sql = """
+        SELECT
+          p.product_id,
+          p.name,
+          p.category,
+          SUM(pp.units_sold)::bigint AS units_sold,
+          ROUND(SUM(pp.revenue_net)::numeric, 2) AS revenue_net
+        FROM {per_product} pp
+        JOIN public.products p ON p.product_id = pp.product_id
+        GROUP BY 1,2,3
+        ORDER BY revenue_net DESC
+        LIMIT :limit;
+    """
+
+    snap = memory_snapshot()
+    if snap is not None:
+        data = snap.top_products(start, end, limit)
+    else:
+        with read_engine().begin() as conn:
+            params = {"start": start, "end": end, "limit": limit}
+            boundary = archive.boundary(conn)
+            if archive.reaches(boundary, start):
+                sql = text(archived_sql.format(per_product=archive.products(params, boundary)))
+            data = [dict(r) for r in conn.execute(sql, params).mappings().all()]
 
     return jsonify(clean_json({
     "start": start_str,
     "end": end_str,
-    "data": [dict(r) for r in rows]
+    "data": data
 }))
 
 
 @app.get("/marketing/roas-by-day")
+@coalesced
 def roas_by_day():
     start_str = request.args.get("start")
     end_str = request.args.get("end")
@@ -265,21 +740,34 @@ def roas_by_day():
     try:
        start = parse_date(start_str)
        end = parse_date(end_str)
+       # Spend is daily, so hourly buckets would not mean anything here.
+       granularity, max_points = series_options(start, end, GRANULARITIES[1:])
     except ValueError as e:
             return jsonify({"error": str(e)}), 400
 
-    sql = text("""
-        WITH rev AS (
+    rev_sql = f"""
           SELECT
-            ol.order_timestamp::date AS day,
+            {bucket_expr("ol.order_timestamp", granularity)} AS day,
             SUM(ol.net_revenue) AS revenue_net
           FROM public.order_lines ol
-          WHERE ol.order_timestamp::date BETWEEN :start AND :end
+          WHERE ol.order_timestamp >= :start AND ol.order_timestamp < CAST(:end AS date) + 1
           GROUP BY 1
-        ),
+    """
+
+    # Archived months are summed from the daily rollup.
+    archived_rev_sql = f"""
+          SELECT
+            {bucket_expr("d.day", granularity)} AS day,
+            SUM(d.revenue_net) AS revenue_net
+          FROM {{days}} d
+          GROUP BY 1
+    """
+
+    sql = f"""
+        WITH rev AS ({{rev}}),
         spend AS (
           SELECT
-            ms.date AS day,
+            {bucket_expr("ms.date", granularity)} AS day,
             SUM(ms.spend_eur) AS spend_eur
           FROM public.marketing_spend ms
           WHERE ms.date BETWEEN :start AND :end
@@ -296,14 +784,190 @@ def roas_by_day():
         FROM rev
         FULL OUTER JOIN spend ON spend.day = rev.day
         ORDER BY 1;
-    """)
-
-    with engine.begin() as conn:
-        rows = conn.execute(sql, {"start": start, "end": end}).mappings().all()
+    """
+
+    snap = memory_snapshot()
+    if snap is not None:
+        data = snap.roas_by_day(start, end, granularity)
+    else:
+        with read_engine().begin() as conn:
+            params = {"start": start, "end": end}
+            boundary = archive.boundary(conn)
+            if archive.reaches(boundary, start):
+                rev_sql = archived_rev_sql.format(days=archive.daily(params, boundary))
+            data = [dict(r) for r in conn.execute(text(sql.format(rev=rev_sql)), params).mappings().all()]
+
+    downsampled = bool(max_points) and len(data) > max_points
+    if downsampled:
+        data = lttb(data, "day", "revenue_net", max_points)
 
     return jsonify(clean_json({
     "start": start_str,
     "end": end_str,
+    "granularity": granularity,
+    "downsampled": downsampled,
+    "data": data
+}))
+
+
+@app.get("/export/order-lines")
+def export_order_lines():
+    start_str = request.args.get("start")
+    end_str = request.args.get("end")
+    if not start_str or not end_str:
+        return jsonify({"error": "Example: /export/order-lines?start=YYYY-MM-DD&end=YYYY-MM-DD&limit=1000"}), 400
+
+    try:
+       start = parse_date(start_str)
+       end = parse_date(end_str)
+       limit = int(request.args.get("limit", EXPORT_DEFAULT_LIMIT))
+       cursor = request.args.get("cursor")
+       after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+    limit = max(1, min(limit, EXPORT_MAX_LIMIT))
+
+    # Keyset pagination on (order_timestamp, order_line_id): each page starts
+    # right after the last key of the previous one, so deep pages cost the same
+    # as the first. Half-open timestamp bounds keep the range index-friendly.
+    sql = f"""
+        SELECT
+          ol.order_line_id,
+          ol.order_id,
+          ol.order_timestamp,
+          ol.customer_id,
+          ol.product_id,
+          ol.qty,
+          ol.gross_revenue,
+          ol.discount_amount,
+          ol.net_revenue,
+          ol.currency
+        FROM {{lines}} ol
+        WHERE ol.order_timestamp >= :start_ts
+          AND ol.order_timestamp < :end_ts
+          {"AND (ol.order_timestamp, ol.order_line_id) > (:after_ts, :after_id)" if after else ""}
+        ORDER BY ol.order_timestamp, ol.order_line_id
+        LIMIT :fetch;
+    """
+    params = {
+        "start_ts": datetime.combine(start, time.min),
+        "end_ts": datetime.combine(end + timedelta(days=1), time.min),
+        "fetch": limit + 1,
+    }
+    if after:
+        params["after_ts"], params["after_id"] = after
+
+    # Archived months are scanned from the page's first key on, and never for
+    # more than one page of rows. Archived rows sort before every hot row, so
+    # they are sent straight from pyarrow and the hot query fills the rest.
+    page_start, page_filter = start, None
+    if after:
+        page_start, page_filter = max(start, after[0].date()), archive.after_key(*after)
+
+    def page(conn):
+        boundary = archive.boundary(conn)
+        archived = archive.scan(conn, "order_lines", list(archive.COLUMNS["order_lines"]), boundary,
+                                page_start, end, page_filter, limit + 1)
+        yield from archived.to_pylist()
+        if archived.num_rows > limit:
+            return
+        params["fetch"] = limit + 1 - archived.num_rows
+        yield from conn.execution_options(
+            stream_results=True, yield_per=EXPORT_FETCH_SIZE
+        ).execute(text(sql.format(lines=archive.hot("order_lines", params, boundary))), params).mappings()
+
+    def generate():
+        yield json.dumps({"start": start_str, "end": end_str, "limit": limit})[:-1] + ', "data": ['
+        sent = 0
+        last = None
+        next_cursor = None
+        # stream_results uses a server-side cursor, so rows arrive in batches of
+        # EXPORT_FETCH_SIZE and memory stays flat however long the range is.
+        with read_engine().connect() as conn:
+            for r in page(conn):
+                if sent == limit:
+                    next_cursor = encode_cursor(last["order_timestamp"], last["order_line_id"])
+                    break
+                yield ("," if sent else "") + json.dumps(clean_json(dict(r)))
+                sent += 1
+                last = r
+        yield "], " + json.dumps({"count": sent, "next_cursor": next_cursor})[1:]
+
+    return Response(stream_with_context(generate()), mimetype="application/json")
+
+
+# Whitelisted sort/group columns for the customer endpoints.
+CUSTOMER_SORTS = ["lifetime_value", "revenue_net", "orders", "last_order_at"]
+CUSTOMER_GROUPS = ["country", "segment"]
+
+
+@app.get("/customers/top")
+@coalesced
+def top_customers():
+    by = request.args.get("by", "lifetime_value")
+    if by not in CUSTOMER_SORTS:
+        return jsonify({"error": f"Invalid by. Use one of: {', '.join(CUSTOMER_SORTS)}"}), 400
+    limit = int(request.args.get("limit", 10))
+
+    # Served from the per-customer aggregate table, so cost depends on the
+    # number of customers, not on order history.
+    sql = text(f"""
+        SELECT
+          c.customer_id,
+          c.full_name,
+          c.country,
+          c.segment,
+          s.orders,
+          s.order_lines,
+          s.revenue_net,
+          s.refunds_total,
+          s.lifetime_value,
+          s.first_order_at,
+          s.last_order_at
+        FROM public.customer_stats s
+        JOIN public.customers c ON c.customer_id = s.customer_id
+        ORDER BY s.{by} DESC NULLS LAST, s.customer_id
+        LIMIT :limit;
+    """)
+
+    with read_engine().begin() as conn:
+        rows = conn.execute(sql, {"limit": limit}).mappings().all()
+
+    return jsonify(clean_json({
+    "by": by,
+    "data": [dict(r) for r in rows]
+}))
+
+
+@app.get("/customers/breakdown")
+@coalesced
+def customer_breakdown():
+    by = request.args.get("by", "country")
+    if by not in CUSTOMER_GROUPS:
+        return jsonify({"error": f"Invalid by. Use one of: {', '.join(CUSTOMER_GROUPS)}"}), 400
+
+    sql = text(f"""
+        SELECT
+          c.{by},
+          COUNT(*) AS customers,
+          SUM(s.orders)::bigint AS orders,
+          ROUND(AVG(s.orders)::numeric, 2) AS orders_per_customer,
+          ROUND(SUM(s.lifetime_value)::numeric, 2) AS lifetime_value,
+          ROUND(AVG(s.lifetime_value)::numeric, 2) AS avg_lifetime_value,
+          MIN(s.first_order_at) AS first_order_at,
+          MAX(s.last_order_at) AS last_order_at
+        FROM public.customer_stats s
+        JOIN public.customers c ON c.customer_id = s.customer_id
+        GROUP BY 1
+        ORDER BY lifetime_value DESC;
+    """)
+
+    with read_engine().begin() as conn:
+        rows = conn.execute(sql).mappings().all()
+
+    return jsonify(clean_json({
+    "by": by,
     "data": [dict(r) for r in rows]
 }))
 
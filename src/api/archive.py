@@ -0,0 +1,293 @@
+"""Archived order-line history (written by scripts/archive_cold.py).
+
+Archiving is opt-in: it is off unless ARCHIVE_DIR points at durable storage
+shared by the pipeline and the API. Closed months older than the retention
+window then live in zstd Parquet files under ARCHIVE_DIR (one file per table
+and month) instead of public.order_lines / public.returns. Returns follow the
+month of their order. public.archive_months lists the archived months;
+everything before `boundary()` is served from the archive, everything on or
+after it from the hot tables. Reads ignore hot rows before the boundary, so
+no row is counted twice. The loaders skip rows the archive already holds
+unchanged (`drop_archived()`); late rows for archived months (new lines or
+refunds, edits) go to the hot tables, and the pipeline's archive_cold stage
+merges them into their month right away. A listed month whose file is
+missing is an error, never an empty month.
+
+Ranges that reach before the boundary are answered from:
+  - the daily rollups public.archive_daily / archive_daily_product, where
+    the answer adds up across days (revenue, line counts, per-day order counts),
+  - archive scans otherwise: `scan()` reads the range's archived rows from
+    Parquet, the caller aggregates them with pyarrow down to the grain its SQL
+    needs (one row per order, so distinct order counts stay exact: an order's
+    lines can be weeks apart, on both sides of the boundary), and `stage()`
+    COPYs that into a temp table the SQL unions with `hot()`. Raw archived
+    rows never go to Postgres; exports and the in-memory snapshot use them
+    straight from pyarrow.
+"""
+import io
+import os
+from datetime import date, datetime, time, timedelta
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+from sqlalchemy import text
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR")   # unset: archiving is off
+
+MANIFEST_TABLE = "archive_months"
+DAILY_TABLE = "archive_daily"
+PRODUCT_TABLE = "archive_daily_product"
+
+# Archived columns with their Postgres types (as in the hot tables).
+COLUMNS = {
+    "order_lines": {
+        "order_line_id": "bigint",
+        "order_id": "bigint",
+        "order_timestamp": "timestamp",
+        "customer_id": "integer",
+        "product_id": "integer",
+        "qty": "integer",
+        "gross_revenue": "numeric(12, 2)",
+        "discount_amount": "numeric(12, 2)",
+        "net_revenue": "numeric(12, 2)",
+        "currency": "text",
+    },
+    "returns": {
+        "order_line_id": "bigint",
+        "order_id": "bigint",
+        "customer_id": "integer",
+        "product_id": "integer",
+        "order_timestamp": "timestamp",
+        "refund_timestamp": "timestamp",
+        "refund_amount": "numeric(12, 2)",
+        "reason": "text",
+    },
+}
+
+ARROW_TYPES = {
+    "bigint": pa.int64(),
+    "integer": pa.int32(),
+    "timestamp": pa.timestamp("us"),
+    "numeric(12, 2)": pa.decimal128(12, 2),
+    "text": pa.string(),
+}
+
+
+def arrow_schema(table: str) -> pa.Schema:
+    return pa.schema([(name, ARROW_TYPES[kind]) for name, kind in COLUMNS[table].items()])
+
+
+def month_path(table: str, month: date) -> str:
+    if not ARCHIVE_DIR:
+        raise RuntimeError(f"{month:%Y-%m} is archived (public.{MANIFEST_TABLE}) but ARCHIVE_DIR is not set")
+    return os.path.join(ARCHIVE_DIR, table, f"{month:%Y-%m}.parquet")
+
+
+def next_month(month: date) -> date:
+    return (month.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def boundary(conn):
+    """First day served by the hot tables, or None when nothing is archived."""
+    if not conn.execute(text(f"SELECT to_regclass('public.{MANIFEST_TABLE}') IS NOT NULL")).scalar():
+        return None
+    last = conn.execute(text(f"SELECT MAX(month) FROM public.{MANIFEST_TABLE}")).scalar()
+    return next_month(last) if last is not None else None
+
+
+def months(conn) -> list:
+    """Months listed in the manifest, oldest first."""
+    if not conn.execute(text(f"SELECT to_regclass('public.{MANIFEST_TABLE}') IS NOT NULL")).scalar():
+        return []
+    return conn.execute(text(f"SELECT month FROM public.{MANIFEST_TABLE} ORDER BY month")).scalars().all()
+
+
+def _row_hashes(df: pd.DataFrame, table: str) -> pd.Series:
+    """One hash per row over `table`'s archived columns, money in cents (as schemas.parse keeps it)."""
+    canonical = pd.DataFrame(index=df.index)
+    for name, kind in COLUMNS[table].items():
+        if kind == "timestamp":
+            canonical[name] = df[name].astype("datetime64[us]")
+        elif kind == "text":
+            canonical[name] = df[name].astype("string")
+        else:
+            canonical[name] = df[name].astype("Int64")
+    return pd.util.hash_pandas_object(canonical, index=False)
+
+
+def drop_archived(df: pd.DataFrame, table: str, boundary_day, archived: list):
+    """Rows of a parsed loader frame for the hot table, and how many of them are late.
+
+    Rows before the boundary that the archive holds unchanged are dropped, so
+    a full reload doesn't bring archived months back. The others are late
+    rows (new lines or refunds for an archived month, or edits): they are
+    kept for the hot table until archive_cold merges them into their month.
+    `archived` are the manifest's months (see `months()`).
+    """
+    if boundary_day is None:
+        return df, 0
+    cold = df["order_timestamp"] < datetime.combine(boundary_day, time.min)
+    if not cold.any():
+        return df, 0
+
+    needed = {date(ts.year, ts.month, 1) for ts in df.loc[cold, "order_timestamp"]}
+    stored = read(table, list(COLUMNS[table]), [m for m in archived if m in needed])
+    for name, kind in COLUMNS[table].items():
+        if kind.startswith("numeric"):
+            cents = pc.multiply(stored[name], pa.scalar(100, pa.decimal128(3, 0))).cast(pa.int64())
+            stored = stored.set_column(stored.schema.get_field_index(name), name, cents)
+
+    keep = ~cold
+    keep[cold] = ~_row_hashes(df[cold], table).isin(set(_row_hashes(stored.to_pandas(), table)))
+    return df[keep], int((keep & cold).sum())
+
+
+def reaches(boundary_day, start) -> bool:
+    """True if a range starting at `start` (None = all history) needs archived months."""
+    return boundary_day is not None and (start is None or start < boundary_day)
+
+
+def read(table: str, columns: list, archived: list, start=None, end=None,
+         where=None, limit: int = None) -> pa.Table:
+    """Archived rows of `table` with order_timestamp::date in [start, end] (None = open).
+
+    `archived` are the manifest's months, oldest first (see `months()`); each
+    one in the range must have its file. `where` is an extra pyarrow.compute
+    filter. Files are sorted by order timestamp, so `limit` keeps the first
+    rows in that order and stops reading once it has them.
+    """
+    ts = pc.field("order_timestamp")
+    bounds = [] if where is None else [where]
+    if start is not None:
+        bounds.append(ts >= datetime.combine(start, time.min))
+    if end is not None:
+        bounds.append(ts < datetime.combine(end + timedelta(days=1), time.min))
+    row_filter = None
+    for expr in bounds:
+        row_filter = expr if row_filter is None else row_filter & expr
+
+    parts, rows = [], 0
+    for month in archived:
+        if (start is not None and next_month(month) <= start) or (end is not None and month > end):
+            continue
+        path = month_path(table, month)
+        if not os.path.exists(path):
+            raise RuntimeError(f"{month:%Y-%m} is archived (public.{MANIFEST_TABLE}) but {path} is missing")
+        part = pq.read_table(path, columns=columns, filters=row_filter)
+        parts.append(part)
+        rows += part.num_rows
+        if limit is not None and rows >= limit:
+            break
+
+    if not parts:
+        return arrow_schema(table).empty_table().select(columns)
+    out = pa.concat_tables(parts)
+    return out.slice(0, limit) if limit is not None else out
+
+
+def after_key(order_timestamp: datetime, order_line_id: int):
+    """`where` filter for rows after a (order_timestamp, order_line_id) keyset cursor."""
+    ts, line_id = pc.field("order_timestamp"), pc.field("order_line_id")
+    return (ts > order_timestamp) | ((ts == order_timestamp) & (line_id > order_line_id))
+
+
+def _bind_boundary(params: dict, boundary_day):
+    params["archive_boundary"] = datetime.combine(boundary_day, time.min)
+
+
+def scan(conn, table: str, columns: list, boundary_day, start=None, end=None,
+         where=None, limit: int = None) -> pa.Table:
+    """Archived rows of `table` over [start, end] (None = open); empty if the range is all hot."""
+    if not reaches(boundary_day, start):
+        return arrow_schema(table).empty_table().select(columns)
+    last_archived = boundary_day - timedelta(days=1)
+    end = last_archived if end is None else min(end, last_archived)
+    return read(table, columns, months(conn), start, end, where, limit)
+
+
+def hot(table: str, params: dict, boundary_day) -> str:
+    """FROM item for the rows of `table` served by the hot tier."""
+    if boundary_day is None:
+        return f"public.{table}"
+    _bind_boundary(params, boundary_day)
+    return f"(SELECT * FROM public.{table} WHERE order_timestamp >= :archive_boundary)"
+
+
+def refunds_by_line(returns: pa.Table) -> pa.Table:
+    """(order_line_id, refunds, refund_amount) per refunded line, as the SQL's pre-aggregated returns."""
+    out = returns.group_by("order_line_id").aggregate([("order_line_id", "count"), ("refund_amount", "sum")])
+    return out.rename_columns({"order_line_id_count": "refunds", "refund_amount_sum": "refund_amount"})
+
+
+def bucket(ts: pa.ChunkedArray, granularity: str) -> pa.ChunkedArray:
+    """Bucket starts as app.bucket_expr computes them: timestamps for hours, dates otherwise."""
+    if granularity == "hour":
+        return pc.floor_temporal(ts, unit="hour")
+    if granularity == "day":
+        return ts.cast(pa.date32())
+    return pc.floor_temporal(ts, unit=granularity, week_starts_monday=True).cast(pa.date32())
+
+
+def _sql_type(arrow_type) -> str:
+    if pa.types.is_decimal(arrow_type):
+        return "numeric"
+    if pa.types.is_timestamp(arrow_type):
+        return "timestamp"
+    return {"int64": "bigint", "int32": "integer", "date32[day]": "date", "string": "text"}[str(arrow_type)]
+
+
+def stage(conn, name: str, rows: pa.Table) -> str:
+    """COPY `rows` (already aggregated by the caller) into temp table `name`, dropped at commit.
+
+    Replicas can't create temp tables, so callers on the API run on the primary.
+    """
+    cols = ", ".join(f"{field.name} {_sql_type(field.type)}" for field in rows.schema)
+    conn.execute(text(f"CREATE TEMP TABLE {name} ({cols}) ON COMMIT DROP"))
+    buf = io.BytesIO()
+    pacsv.write_csv(rows, buf, pacsv.WriteOptions(include_header=False))
+    buf.seek(0)
+    conn.connection.cursor().copy_expert(f"COPY {name} FROM STDIN WITH (FORMAT csv)", buf)
+    return name
+
+
+def daily(params: dict, boundary_day) -> str:
+    """FROM item of (day, revenue_net, orders, order_lines, refunded_lines) for each day in [:start, :end].
+
+    Hot days are aggregated from order_lines, archived days come from the
+    rollup. Days never overlap, so per-day order counts stay exact.
+    """
+    _bind_boundary(params, boundary_day)
+    return f"""(
+          SELECT ol.order_timestamp::date AS day, SUM(ol.net_revenue) AS revenue_net, COUNT(DISTINCT ol.order_id) AS orders,
+                 SUM(COALESCE(r.refunds, 1))::bigint AS order_lines, COALESCE(SUM(r.refunds), 0)::bigint AS refunded_lines
+          FROM public.order_lines ol
+          LEFT JOIN (SELECT order_line_id, COUNT(*) AS refunds FROM public.returns GROUP BY 1) r
+            ON r.order_line_id = ol.order_line_id
+          WHERE ol.order_timestamp >= :start AND ol.order_timestamp < CAST(:end AS date) + 1
+            AND ol.order_timestamp >= :archive_boundary
+          GROUP BY 1
+          UNION ALL
+          SELECT ad.day, ad.revenue_net, ad.orders, ad.order_lines, ad.refunded_lines
+          FROM public.{DAILY_TABLE} ad
+          WHERE ad.day BETWEEN :start AND :end
+        )"""
+
+
+def products(params: dict, boundary_day) -> str:
+    """FROM item of (product_id, units_sold, revenue_net) over [:start, :end], one row per product and tier."""
+    _bind_boundary(params, boundary_day)
+    return f"""(
+          SELECT ol.product_id, SUM(ol.qty) AS units_sold, SUM(ol.net_revenue) AS revenue_net
+          FROM public.order_lines ol
+          WHERE ol.order_timestamp >= :start AND ol.order_timestamp < CAST(:end AS date) + 1
+            AND ol.order_timestamp >= :archive_boundary
+          GROUP BY 1
+          UNION ALL
+          SELECT adp.product_id, SUM(adp.units_sold), SUM(adp.revenue_net)
+          FROM public.{PRODUCT_TABLE} adp
+          WHERE adp.day BETWEEN :start AND :end
+          GROUP BY 1
+        )"""
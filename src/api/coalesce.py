@@ -0,0 +1,132 @@
+"""Single-flight request coalescing.
+
+Concurrent callers with the same key wait on one execution and share its
+result. Within a process this uses a dict of in-flight calls; when
+COALESCE_DIR is set, a per-key file lock extends it across gunicorn workers
+on the same host (the leader writes its result next to the lock, and workers
+that were waiting read it instead of running the query again).
+
+A result file only serves callers that arrived before it was written, so the
+next leader for the key deletes it, and files idle for COALESCE_TTL seconds
+(results, and lock files no worker holds) are swept from COALESCE_DIR.
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+
+COALESCE_DIR = os.getenv("COALESCE_DIR")
+COALESCE_TTL = float(os.getenv("COALESCE_TTL", "60"))
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+_last_sweep = 0.0
+
+
+def single_flight(key: str, fn):
+    """Run fn() once per key for all overlapping callers. fn must return JSON-friendly data."""
+    with _inflight_lock:
+        call = _inflight.get(key)
+        leader = call is None
+        if leader:
+            call = _inflight[key] = _Call()
+
+    if not leader:
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    try:
+        call.result = _cross_process(key, fn) if COALESCE_DIR else fn()
+    except BaseException as e:
+        call.error = e
+        raise
+    finally:
+        with _inflight_lock:
+            del _inflight[key]
+        call.done.set()
+    return call.result
+
+
+def _open_lock(path: str):
+    """Open and exclusively lock `path`, retrying if a sweep unlinked it meanwhile."""
+    import fcntl
+
+    while True:
+        lock = open(path, "a")
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            if os.stat(path).st_ino == os.fstat(lock.fileno()).st_ino:
+                os.utime(path)
+                return lock
+        except FileNotFoundError:
+            pass
+        lock.close()
+
+
+def _sweep(now: float):
+    """Delete results and unheld lock files idle for COALESCE_TTL seconds."""
+    import fcntl
+
+    global _last_sweep
+    if now - _last_sweep < COALESCE_TTL:
+        return
+    _last_sweep = now
+
+    for entry in os.scandir(COALESCE_DIR):
+        try:
+            if now - entry.stat().st_mtime < COALESCE_TTL:
+                continue
+            if not entry.name.endswith(".lock"):
+                os.unlink(entry.path)
+                continue
+            with open(entry.path, "a") as lock:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                os.unlink(entry.path)
+        except FileNotFoundError:
+            pass
+
+
+def _cross_process(key: str, fn):
+    import fcntl
+
+    os.makedirs(COALESCE_DIR, exist_ok=True)
+    base = os.path.join(COALESCE_DIR, hashlib.sha256(key.encode("utf-8")).hexdigest())
+    arrived = time.time()
+
+    lock = _open_lock(base + ".lock")
+    try:
+        # Another worker finished this exact query while we were waiting.
+        try:
+            if os.stat(base + ".json").st_mtime >= arrived:
+                with open(base + ".json", "r", encoding="utf-8") as f:
+                    return json.load(f)
+            # Written before we arrived: whoever it was for has read it.
+            os.unlink(base + ".json")
+        except (FileNotFoundError, ValueError):
+            pass
+
+        result = fn()
+        tmp = f"{base}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        os.replace(tmp, base + ".json")
+    finally:
+        fcntl.flock(lock, fcntl.LOCK_UN)
+        lock.close()
+
+    _sweep(time.time())
+    return result
@@ -0,0 +1,322 @@
+"""In-memory columnar analytics (ANALYTICS_ENGINE=memory).
+
+Loads order_lines, products, returns and marketing_spend into NumPy arrays:
+order lines sorted by order timestamp with day offsets (days since
+1970-01-01), money as integer cents, and products/categories dictionary-encoded.
+A date range becomes two binary searches, and every aggregate is a vectorized
+group-by over that slice. Outputs use the same rounding as the SQL queries, so
+both paths return identical JSON.
+Months moved to the Parquet archive (archive.py) are read back in straight
+from pyarrow, so a snapshot covers the full history.
+
+Snapshots are immutable. A reload builds a new one in a background thread and
+swaps the reference, so requests never see a half-loaded dataset.
+"""
+import threading
+import traceback
+from decimal import Decimal, ROUND_HALF_UP
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from sqlalchemy import text
+
+import archive
+
+EPOCH = date(1970, 1, 1)
+EPOCH_DT = datetime(1970, 1, 1)
+
+# {lines} / {returns} are the hot rows (archive.hot); archived ones come from _archived().
+LINES_SQL = """
+    SELECT
+      (ol.order_timestamp::date - DATE '1970-01-01') AS day,
+      EXTRACT(EPOCH FROM ol.order_timestamp)::bigint AS ts,
+      ol.order_line_id,
+      ol.order_id,
+      ol.product_id,
+      COALESCE(ol.qty, 0) AS qty,
+      ROUND(COALESCE(ol.net_revenue, 0) * 100)::bigint AS net_cents
+    FROM {lines} ol
+    ORDER BY ol.order_timestamp, ol.order_line_id
+"""
+
+REFUNDS_SQL = """
+    SELECT
+      r.order_line_id,
+      COUNT(*) AS refunds,
+      ROUND(COALESCE(SUM(r.refund_amount), 0) * 100)::bigint AS refund_cents
+    FROM {returns} r
+    GROUP BY 1
+"""
+
+PRODUCTS_SQL = text("SELECT product_id, name, category FROM public.products ORDER BY product_id")
+
+SPEND_SQL = text("""
+    SELECT
+      (ms.date - DATE '1970-01-01') AS day,
+      ROUND(COALESCE(ms.spend_eur, 0) * 100)::bigint AS spend_cents
+    FROM public.marketing_spend ms
+    ORDER BY ms.date
+""")
+
+
+def _round(numerator: int, denominator: int, places: str) -> float:
+    """numeric division + ROUND(x, n) the way Postgres does it (half away from zero)."""
+    return float((Decimal(numerator) / Decimal(denominator)).quantize(Decimal(places), ROUND_HALF_UP))
+
+
+def _columns(rows, n_cols: int):
+    arr = np.array(rows, dtype=np.int64).reshape(-1, n_cols)
+    return [arr[:, i] for i in range(n_cols)]
+
+
+def _cents(values) -> np.ndarray:
+    """Decimal column (line amounts or their per-line sums) as integer cents, NULL as 0."""
+    values = pc.fill_null(values.cast(pa.decimal128(18, 2)), pa.scalar(Decimal(0), pa.decimal128(18, 2)))
+    return pc.multiply(values, pa.scalar(Decimal(100), pa.decimal128(3, 0))).cast(pa.int64()).to_numpy()
+
+
+def _archived(conn, boundary):
+    """Archived order lines and per-line refunds, as the columns LINES_SQL / REFUNDS_SQL return."""
+    lines = archive.scan(conn, "order_lines", ["order_timestamp", "order_line_id", "order_id", "product_id", "qty", "net_revenue"],
+                         boundary).sort_by([("order_timestamp", "ascending"), ("order_line_id", "ascending")])
+    ts = lines["order_timestamp"].cast(pa.int64()).to_numpy() // 1_000_000
+    refunds = archive.refunds_by_line(archive.scan(conn, "returns", ["order_line_id", "refund_amount"], boundary))
+    return (
+        [ts // 86400, ts, lines["order_line_id"].to_numpy(), lines["order_id"].to_numpy(),
+         lines["product_id"].to_numpy(), pc.fill_null(lines["qty"], 0).to_numpy(), _cents(lines["net_revenue"])],
+        [refunds["order_line_id"].to_numpy(), refunds["refunds"].to_numpy(), _cents(refunds["refund_amount"])],
+    )
+
+
+def _merge_refunds(parts):
+    """Per-line refund columns of both tiers, summed per line as REFUNDS_SQL's GROUP BY would."""
+    line_id = np.concatenate([p[0] for p in parts])
+    uniq, idx = np.unique(line_id, return_inverse=True)
+    return [uniq] + [np.bincount(idx, weights=np.concatenate([p[i] for p in parts]), minlength=len(uniq)).astype(np.int64)
+                     for i in (1, 2)]
+
+
+def _groups(keys):
+    """Unique keys plus each element's group index."""
+    return np.unique(keys, return_inverse=True)
+
+
+def _group_sum(idx, values, n: int):
+    return np.rint(np.bincount(idx, weights=values, minlength=n)).astype(np.int64)
+
+
+def _group_distinct(idx, values, n: int):
+    order = np.lexsort((values, idx))
+    g, v = idx[order], values[order]
+    first = np.ones(len(g), dtype=bool)
+    first[1:] = (g[1:] != g[:-1]) | (v[1:] != v[:-1])
+    return np.bincount(g[first], minlength=n)
+
+
+def _buckets(days, ts, granularity: str):
+    """Bucket keys (monotonic in time) and a function turning a key into its label."""
+    if granularity == "hour":
+        return ts // 3600, lambda k: EPOCH_DT + timedelta(hours=int(k))
+    if granularity == "day":
+        return days, lambda k: EPOCH + timedelta(days=int(k))
+    if granularity == "week":
+        # 1970-01-01 was a Thursday; shift back to the ISO week's Monday.
+        return days - (days + 3) % 7, lambda k: EPOCH + timedelta(days=int(k))
+    months = days.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+    return months, lambda k: date(1970 + int(k) // 12, int(k) % 12 + 1, 1)
+
+
+class Snapshot:
+    def __init__(self, version, lines, refunds, products, spend):
+        day, ts, line_id, order_id, product_id, qty, net = lines
+        self.version = version
+
+        self.day = day.astype(np.int32)
+        self.ts = ts
+        self.order_id = order_id
+        self.qty = qty.astype(np.int32)
+        self.net = net
+
+        # Refunds folded onto their order line (LEFT JOIN returns).
+        self.refund_count = np.zeros(len(line_id), dtype=np.int32)
+        self.refund_cents = np.zeros(len(line_id), dtype=np.int64)
+        ref_line, ref_count, ref_cents = refunds
+        if len(line_id) and len(ref_line):
+            by_id = np.argsort(line_id)
+            pos = np.searchsorted(line_id, ref_line, sorter=by_id).clip(0, len(line_id) - 1)
+            hit = line_id[by_id[pos]] == ref_line
+            self.refund_count[by_id[pos[hit]]] = ref_count[hit]
+            self.refund_cents[by_id[pos[hit]]] = ref_cents[hit]
+
+        # Products: dictionary-encoded names/categories; lines point at a
+        # product code, -1 when the product is missing (inner join drops it).
+        p_ids, p_names, p_cats = products
+        self.product_ids = np.array(p_ids, dtype=np.int64)
+        self.product_names = list(p_names)
+        self.categories = sorted(set(p_cats), key=lambda c: (c is None, str(c)))
+        lookup = {c: i for i, c in enumerate(self.categories)}
+        self.product_category = np.array([lookup[c] for c in p_cats], dtype=np.int32)
+        self.product_code = np.full(len(product_id), -1, dtype=np.int32)
+        if len(self.product_ids) and len(product_id):
+            pos = np.searchsorted(self.product_ids, product_id).clip(0, len(self.product_ids) - 1)
+            hit = self.product_ids[pos] == product_id
+            self.product_code[hit] = pos[hit]
+
+        self.spend_day, self.spend_cents = spend
+        self.spend_day = self.spend_day.astype(np.int32)
+
+    @classmethod
+    def load(cls, engine):
+        with engine.connect() as conn:
+            # One consistent view of all four tables.
+            conn = conn.execution_options(isolation_level="REPEATABLE READ")
+            with conn.begin():
+                if conn.execute(text("SELECT to_regclass('public.dataset_version') IS NOT NULL")).scalar():
+                    version = conn.execute(text("SELECT MAX(version) FROM public.dataset_version")).scalar() or 0
+                else:
+                    version = 0
+                params, boundary = {}, archive.boundary(conn)
+                hot_lines = archive.hot("order_lines", params, boundary)
+                hot_returns = archive.hot("returns", params, boundary)
+                lines = _columns(conn.execute(text(LINES_SQL.format(lines=hot_lines)), params).fetchall(), 7)
+                refunds = _columns(conn.execute(text(REFUNDS_SQL.format(returns=hot_returns)), params).fetchall(), 3)
+                if archive.reaches(boundary, None):
+                    # Archived rows all sort before the hot ones.
+                    cold_lines, cold_refunds = _archived(conn, boundary)
+                    lines = [np.concatenate([c.astype(np.int64), h]) for c, h in zip(cold_lines, lines)]
+                    refunds = _merge_refunds([cold_refunds, refunds])
+                products = list(zip(*conn.execute(PRODUCTS_SQL).fetchall())) or [(), (), ()]
+                spend = _columns(conn.execute(SPEND_SQL).fetchall(), 2)
+        return cls(version, lines, refunds, products, spend)
+
+    def _range(self, days, start: date, end: date):
+        lo = np.searchsorted(days, (start - EPOCH).days, side="left")
+        hi = np.searchsorted(days, (end - EPOCH).days, side="right")
+        return slice(lo, hi)
+
+    def kpis(self, start: date, end: date) -> dict:
+        s = self._range(self.day, start, end)
+        n_ref = self.refund_count[s].astype(np.int64)
+        # LEFT JOIN semantics: a line with k refunds appears k times.
+        weight = np.maximum(n_ref, 1)
+        revenue = int((self.net[s] * weight).sum())
+        refunds = int(self.refund_cents[s].sum())
+        lines = int(weight.sum())
+        orders = int(np.unique(self.order_id[s]).size)
+        return {
+            "revenue_net": revenue / 100,
+            "refunds_total": refunds / 100,
+            "revenue_after_refunds": (revenue - refunds) / 100,
+            "orders": orders,
+            "order_lines": lines,
+            "refund_rate_pct": _round(100 * int(n_ref.sum()), lines, "0.01") if lines else None,
+            "aov": _round(revenue, 100 * orders, "0.01") if orders else None,
+        }
+
+    def revenue_by_day(self, start: date, end: date, granularity: str) -> list:
+        s = self._range(self.day, start, end)
+        keys, label = _buckets(self.day[s], self.ts[s], granularity)
+        uniq, idx = _groups(keys)
+        revenue = _group_sum(idx, self.net[s], len(uniq))
+        orders = _group_distinct(idx, self.order_id[s], len(uniq))
+        n_ref = self.refund_count[s].astype(np.int64)
+        lines = _group_sum(idx, np.maximum(n_ref, 1), len(uniq))
+        refunded = _group_sum(idx, n_ref, len(uniq))
+        return [
+            {"day": label(k), "revenue_net": int(r) / 100, "orders": int(o),
+             "order_lines": int(n), "refunded_lines": int(f)}
+            for k, r, o, n, f in zip(uniq, revenue, orders, lines, refunded)
+        ]
+
+    def _with_product(self, start: date, end: date):
+        s = self._range(self.day, start, end)
+        code = self.product_code[s]
+        keep = code >= 0
+        return code[keep], self.net[s][keep], self.order_id[s][keep], self.qty[s][keep]
+
+    def revenue_by_category(self, start: date, end: date) -> list:
+        code, net, order_id, _ = self._with_product(start, end)
+        uniq, idx = _groups(self.product_category[code])
+        revenue = _group_sum(idx, net, len(uniq))
+        orders = _group_distinct(idx, order_id, len(uniq))
+        rows = [
+            {
+                "category": self.categories[c],
+                "revenue_net": int(r) / 100,
+                "orders": int(o),
+            }
+            for c, r, o in zip(uniq, revenue, orders)
+        ]
+        return sorted(rows, key=lambda r: -r["revenue_net"])
+
+    def top_products(self, start: date, end: date, limit: int) -> list:
+        code, net, _, qty = self._with_product(start, end)
+        uniq, idx = _groups(code)
+        revenue = _group_sum(idx, net, len(uniq))
+        units = _group_sum(idx, qty, len(uniq))
+        top = np.lexsort((self.product_ids[uniq], -revenue))[:max(limit, 0)]
+        return [
+            {
+                "product_id": int(self.product_ids[uniq[i]]),
+                "name": self.product_names[uniq[i]],
+                "category": self.categories[self.product_category[uniq[i]]],
+                "units_sold": int(units[i]),
+                "revenue_net": int(revenue[i]) / 100,
+            }
+            for i in top
+        ]
+
+    def roas_by_day(self, start: date, end: date, granularity: str) -> list:
+        s = self._range(self.day, start, end)
+        rev_keys, label = _buckets(self.day[s], self.ts[s], granularity)
+        m = self._range(self.spend_day, start, end)
+        spend_keys, _ = _buckets(self.spend_day[m], None, granularity)
+
+        uniq, idx = _groups(np.concatenate([rev_keys, spend_keys]))
+        n_rev = len(rev_keys)
+        revenue = _group_sum(idx[:n_rev], self.net[s], len(uniq))
+        spend = _group_sum(idx[n_rev:], self.spend_cents[m], len(uniq))
+        return [
+            {
+                "day": label(k),
+                "revenue_net": int(r) / 100,
+                "spend_eur": int(sp) / 100,
+                "roas": _round(int(r), int(sp), "0.0001") if sp else None,
+            }
+            for k, r, sp in zip(uniq, revenue, spend)
+        ]
+
+
+class ColumnarStore:
+    """Holds the current Snapshot and reloads it when the dataset version moves."""
+
+    def __init__(self, engine_for):
+        self.engine_for = engine_for
+        self.snapshot = None
+        self._loading = False
+        self._lock = threading.Lock()
+
+    def get(self, version: int):
+        """Snapshot at `version` or newer, else None (callers fall back to SQL)."""
+        snap = self.snapshot
+        if snap is not None and snap.version >= version:
+            return snap
+        self.refresh_async(version)
+        return None
+
+    def refresh_async(self, version: int):
+        with self._lock:
+            if self._loading:
+                return
+            self._loading = True
+        threading.Thread(target=self._reload, args=(version,), daemon=True).start()
+
+    def _reload(self, version: int):
+        try:
+            self.snapshot = Snapshot.load(self.engine_for(version))
+        except Exception:
+            traceback.print_exc()
+        finally:
+            self._loading = False
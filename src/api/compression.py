@@ -0,0 +1,150 @@
+"""Accept-Encoding negotiation and response compression.
+
+gzip is always available. brotli (`br`) and zstd are offered when the
+`brotli` / `zstandard` packages are installed, and preferred over gzip
+because they compress JSON better at similar CPU cost. Bodies smaller than
+COMPRESS_MIN_SIZE bytes go out as they are: below about a kilobyte the
+headers and framing eat most of the saving.
+
+Compressed bodies of coalesced responses are memoized per (request key,
+encoding) in an LRU of COMPRESS_CACHE_BYTES bytes, so followers of a shared
+result and later identical requests don't compress the same body again.
+"""
+import os
+import zlib
+import threading
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+ZSTD_LEVEL = 3
+COMPRESS_CACHE_BYTES = int(os.getenv("COMPRESS_CACHE_BYTES", str(64 << 20)))
+
+# Server preference, best first, for encodings the client rates equally.
+ENCODINGS = (["br"] if brotli else []) + (["zstd"] if zstandard else []) + ["gzip"]
+
+
+def negotiate(accept_encoding: str):
+    """Pick an encoding from an Accept-Encoding header, or None for identity."""
+    weights = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[coding] = q
+
+    best, best_q = None, 0.0
+    for coding in ENCODINGS:
+        q = weights.get(coding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    c = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # 31 = gzip container
+    return c.compress(data) + c.flush()
+
+
+_cache = OrderedDict()   # (key, encoding) -> (checksum, compressed body)
+_cache_bytes = 0
+_cache_lock = threading.Lock()
+
+
+def compress_cached(key: str, data: bytes, encoding: str) -> bytes:
+    """compress(data, encoding), reused while `key` maps to the same body.
+
+    The body's length and adler32 are checked on a hit, so a key whose body
+    changed is compressed again rather than served stale.
+    """
+    global _cache_bytes
+    checksum = (len(data), zlib.adler32(data))
+    with _cache_lock:
+        hit = _cache.get((key, encoding))
+        if hit is not None and hit[0] == checksum:
+            _cache.move_to_end((key, encoding))
+            return hit[1]
+
+    out = compress(data, encoding)
+    if len(out) > COMPRESS_CACHE_BYTES:
+        return out
+    with _cache_lock:
+        old = _cache.pop((key, encoding), None)
+        if old is not None:
+            _cache_bytes -= len(old[1])
+        _cache[(key, encoding)] = (checksum, out)
+        _cache_bytes += len(out)
+        while _cache_bytes > COMPRESS_CACHE_BYTES:
+            _, (_, evicted) = _cache.popitem(last=False)
+            _cache_bytes -= len(evicted)
+    return out
+
+
+def compress_stream(chunks, encoding: str):
+    """Compress an iterable of chunks incrementally.
+
+    Output is yielded whenever the compressor emits a block, so memory stays
+    bounded and the client starts receiving data before the stream ends.
+    """
+    if encoding == "br":
+        c = brotli.Compressor(quality=BROTLI_QUALITY)
+        feed, finish = c.process, c.finish
+    elif encoding == "zstd":
+        c = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+        feed, finish = c.compress, c.flush
+    else:
+        c = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        feed, finish = c.compress, c.flush
+
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode("utf-8")
+        out = feed(chunk)
+        if out:
+            yield out
+    yield finish()
+
+
+def apply(resp, accept_encoding: str):
+    """Compress a Flask response in place if the client accepts it and it's worth it."""
+    resp.vary.add("Accept-Encoding")
+    if resp.status_code != 200 or resp.direct_passthrough or "Content-Encoding" in resp.headers:
+        return resp
+    encoding = negotiate(accept_encoding)
+    if encoding is None:
+        return resp
+
+    if resp.is_streamed:
+        resp.response = compress_stream(resp.response, encoding)
+        resp.headers.pop("Content-Length", None)
+    else:
+        body = resp.get_data()
+        if len(body) < COMPRESS_MIN_SIZE:
+            return resp
+        resp.set_data(compress(body, encoding))
+    resp.headers["Content-Encoding"] = encoding
+    return resp
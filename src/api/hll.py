@@ -0,0 +1,97 @@
+"""HyperLogLog distinct-count sketches.
+
+Each sketch is M = 2**P one-byte registers (4 KB at P = 12). Sketches of
+disjoint or overlapping sets merge by taking the register-wise maximum, so
+per-day sketches can answer distinct counts over any date range.
+
+Error bound: the relative standard error is 1.04 / sqrt(M), about 1.6% at
+P = 12, so roughly 95% of estimates fall within 3.3% of the exact count.
+Below a few hundred distinct values the error is dominated by register
+collisions and is usually a count or two.
+"""
+import numpy as np
+
+P = 12
+M = 1 << P
+STD_ERROR = 1.04 / np.sqrt(M)
+
+_REST = 64 - P
+
+
+def _hash(values):
+    """splitmix64 finalizer: a fast, well-mixed 64-bit hash of integer ids."""
+    x = np.asarray(values).astype(np.uint64)
+    with np.errstate(over="ignore"):
+        x = x + np.uint64(0x9E3779B97F4A7C15)
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def _bit_length(x):
+    x = x.copy()
+    n = np.zeros(x.shape, dtype=np.int64)
+    for s in (32, 16, 8, 4, 2, 1):
+        big = (x >> np.uint64(s)) > 0
+        n[big] += s
+        x[big] >>= np.uint64(s)
+    return n + (x > 0)
+
+
+def build(groups, values, n_groups: int):
+    """One sketch per group: uint8 array of shape (n_groups, M)."""
+    h = _hash(values)
+    register = (h >> np.uint64(_REST)).astype(np.int64)
+    rest = h & np.uint64((1 << _REST) - 1)
+    rank = (_REST - _bit_length(rest) + 1).astype(np.uint8)
+
+    sketches = np.zeros((n_groups, M), dtype=np.uint8)
+    np.maximum.at(sketches, (np.asarray(groups, dtype=np.int64), register), rank)
+    return sketches
+
+
+def merge(sketches):
+    """Union of a sequence of sketches (bytes or arrays)."""
+    out = np.zeros(M, dtype=np.uint8)
+    for s in sketches:
+        np.maximum(out, np.frombuffer(s, dtype=np.uint8), out=out)
+    return out
+
+
+def _sigma(x: float) -> float:
+    if x == 1.0:
+        return float("inf")
+    y, z = 1.0, x
+    while True:
+        x *= x
+        z_old = z
+        z += x * y
+        y += y
+        if z == z_old:
+            return z
+
+
+def _tau(x: float) -> float:
+    if x == 0.0 or x == 1.0:
+        return 0.0
+    y, z = 1.0, 1.0 - x
+    while True:
+        x = np.sqrt(x)
+        z_old = z
+        y *= 0.5
+        z -= (1.0 - x) ** 2 * y
+        if z == z_old:
+            return z / 3
+
+
+def estimate(sketch) -> int:
+    """Ertl's improved estimator: no bias tables and no switch-over between
+    small- and large-range formulas, so the error stays at STD_ERROR throughout."""
+    registers = np.frombuffer(sketch, dtype=np.uint8)
+    counts = np.bincount(registers, minlength=_REST + 2).astype(np.float64)
+
+    z = M * _tau(1.0 - counts[_REST + 1] / M)
+    for k in range(_REST, 0, -1):
+        z = 0.5 * (z + counts[k])
+    z += M * _sigma(counts[0] / M)
+    return int(round(M * M / (2 * np.log(2)) / z))
@@ -0,0 +1,136 @@
+"""Opt-in profiling for pipeline stages and API requests.
+
+Two modes, both writing collapsed stacks ("frame;frame;frame weight" lines)
+that flamegraph.pl, speedscope or inferno read directly:
+  - sample: a background thread snapshots the profiled thread's stack every
+    PROFILE_INTERVAL seconds (default 5 ms). Weights are sample counts.
+    Cheap enough for real workloads.
+  - trace:  deterministic sys.setprofile tracing of every Python and C call.
+    Weights are self time in microseconds. Exact, but several times slower.
+
+The root frame of every stack is the tag plus parameters (for example
+`load_orders?incremental=False` or `/kpis?start=...`), so files from
+different stages or requests can be merged and still told apart. Each
+profile also gets a .json sidecar with the tag, params, mode and duration.
+Nothing here runs unless a profile is requested.
+"""
+import os
+import sys
+import json
+import time
+import threading
+from collections import Counter
+from datetime import datetime
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+MODES = ["sample", "trace"]
+
+
+def _label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class _Sampler:
+    def __init__(self, thread_id: int):
+        self.thread_id = thread_id
+        self.counts = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(PROFILE_INTERVAL):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.counts[";".join(reversed(stack))] += 1
+
+
+class _Tracer:
+    def __init__(self):
+        self.counts = Counter()
+        self._stack = []   # [label, start, child time]
+
+    def start(self):
+        sys.setprofile(self._event)
+
+    def stop(self):
+        sys.setprofile(None)
+        now = time.perf_counter()
+        while self._stack:
+            self._pop(now)
+
+    def _event(self, frame, event, arg):
+        now = time.perf_counter()
+        if event == "call":
+            self._stack.append([_label(frame.f_code), now, 0.0])
+        elif event == "c_call":
+            self._stack.append([f"{getattr(arg, '__qualname__', repr(arg))} (builtin)", now, 0.0])
+        elif event in ("return", "c_return", "c_exception") and self._stack:
+            self._pop(now)
+
+    def _pop(self, now: float):
+        key = ";".join(entry[0] for entry in self._stack)
+        label, start, child = self._stack.pop()
+        elapsed = now - start
+        self.counts[key] += max(int((elapsed - child) * 1e6), 0)
+        if self._stack:
+            self._stack[-1][2] += elapsed
+
+
+class Profile:
+    """Context manager profiling the current thread; `.path` is the written file."""
+
+    def __init__(self, tag: str, params: dict = None, mode: str = "sample"):
+        if mode not in MODES:
+            raise ValueError(f"Invalid profile mode. Use one of: {', '.join(MODES)}")
+        self.tag = tag
+        self.params = {k: v for k, v in (params or {}).items() if k != "profile"}
+        self.mode = mode
+        self.path = None
+
+    def root(self) -> str:
+        query = "&".join(f"{k}={v}" for k, v in sorted(self.params.items()))
+        return (f"{self.tag}?{query}" if query else self.tag).replace(";", ",").replace(" ", "_")
+
+    def __enter__(self):
+        self._collector = _Sampler(threading.get_ident()) if self.mode == "sample" else _Tracer()
+        self._started = datetime.now()
+        self._t0 = time.perf_counter()
+        self._collector.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._collector.stop()
+        elapsed = time.perf_counter() - self._t0
+        root = self.root()
+
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        slug = "".join(c if c.isalnum() or c in "-_" else "_" for c in self.tag.strip("/")) or "root"
+        base = os.path.join(PROFILE_DIR, f"{slug}-{self._started:%Y%m%dT%H%M%S%f}-{self.mode}")
+        with open(base + ".collapsed", "w", encoding="utf-8") as f:
+            for stack, weight in sorted(self._collector.counts.items()):
+                if weight:
+                    f.write(f"{root};{stack} {weight}\n")
+        with open(base + ".json", "w", encoding="utf-8") as f:
+            json.dump({
+                "tag": self.tag,
+                "params": {k: str(v) for k, v in self.params.items()},
+                "mode": self.mode,
+                "weight": "samples" if self.mode == "sample" else "microseconds",
+                "interval_s": PROFILE_INTERVAL if self.mode == "sample" else None,
+                "started_at": self._started.isoformat(),
+                "duration_s": round(elapsed, 4),
+            }, f, indent=2)
+        self.path = base + ".collapsed"
+        return False
@@ -0,0 +1,102 @@
+"""Route API reads to read replicas.
+
+Replicas come from DATABASE_READ_URLS (comma-separated). A background
+thread health-checks each one every REPLICA_CHECK_INTERVAL seconds by reading
+its latest dataset version; connecting gives up after REPLICA_CONNECT_TIMEOUT
+seconds, so an unreachable replica can't stall the checks for long. Requests
+only read the cached results. Reads go round-robin to healthy replicas that
+have caught up to the version the primary reports; when none has, the router
+waits up to REPLICA_WAIT_TIMEOUT seconds (asking the thread for an early
+check) and then falls back to the primary.
+"""
+import os
+import time
+import threading
+import itertools
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import ProgrammingError
+
+REPLICA_CHECK_INTERVAL = float(os.getenv("REPLICA_CHECK_INTERVAL", "5"))
+REPLICA_WAIT_TIMEOUT = float(os.getenv("REPLICA_WAIT_TIMEOUT", "0"))
+REPLICA_CONNECT_TIMEOUT = int(os.getenv("REPLICA_CONNECT_TIMEOUT", "3"))
+REPLICA_POLL = 0.25
+
+VERSION_SQL = text("SELECT MAX(version) FROM public.dataset_version")
+
+
+class Replica:
+    def __init__(self, url: str):
+        self.engine = create_engine(
+            url, pool_pre_ping=True, connect_args={"connect_timeout": REPLICA_CONNECT_TIMEOUT},
+        )
+        self.healthy = False
+        self.version = -1
+        self.checked = 0.0
+
+    def check(self):
+        try:
+            with self.engine.connect() as conn:
+                version = conn.execute(VERSION_SQL).scalar() or 0
+        except ProgrammingError:
+            # Reachable, but no pipeline run has been replicated yet.
+            version = 0
+        except Exception:
+            self.healthy, self.checked = False, time.monotonic()
+            return
+        self.healthy, self.version, self.checked = True, version, time.monotonic()
+
+
+class ReadRouter:
+    def __init__(self, primary, replica_urls):
+        self.primary = primary
+        self.replicas = [Replica(u) for u in replica_urls]
+        self._next = itertools.count()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._checker = None
+        self._checker_pid = None
+
+    def _ensure_checker(self):
+        # Started on first use and again after a fork (gunicorn --preload),
+        # since threads don't survive into the child.
+        if self._checker_pid == os.getpid():
+            return
+        with self._lock:
+            if self._checker_pid != os.getpid():
+                self._checker = threading.Thread(target=self._check_loop, name="replica-health", daemon=True)
+                self._checker.start()
+                self._checker_pid = os.getpid()
+
+    def _check_loop(self):
+        while True:
+            for r in self.replicas:
+                r.check()
+            self._wake.wait(REPLICA_CHECK_INTERVAL)
+            self._wake.clear()
+
+    def _pick(self, min_version: int):
+        ready = [r for r in self.replicas if r.healthy and r.version >= min_version]
+        if not ready:
+            return None
+        return ready[next(self._next) % len(ready)].engine
+
+    def engine_for(self, min_version: int = 0):
+        """Engine to read from: a caught-up replica if possible, else the primary."""
+        if not self.replicas:
+            return self.primary
+
+        self._ensure_checker()
+        engine = self._pick(min_version)
+        if engine is not None:
+            return engine
+
+        # A pipeline run just finished; give replication a moment to catch up.
+        deadline = time.monotonic() + REPLICA_WAIT_TIMEOUT
+        while time.monotonic() < deadline:
+            self._wake.set()
+            time.sleep(REPLICA_POLL)
+            engine = self._pick(min_version)
+            if engine is not None:
+                return engine
+        return self.primary
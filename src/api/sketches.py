@@ -0,0 +1,84 @@
+"""Approximate answers (approx=true) from the per-day sketch tables.
+
+Additive totals are summed and HyperLogLog sketches are merged across the
+range, so cost depends on the number of days, not on order lines. Distinct
+counts carry the error bound documented in hll.py. Everything else is exact.
+"""
+from decimal import Decimal, ROUND_HALF_UP
+from itertools import groupby
+
+from sqlalchemy import text
+
+import hll
+
+ERROR_PCT = round(float(hll.STD_ERROR) * 100, 2)
+
+
+def _round(value, places: str):
+    return Decimal(value).quantize(Decimal(places), ROUND_HALF_UP)
+
+
+def kpis(conn, start, end) -> dict:
+    rows = conn.execute(text("""
+        SELECT order_lines, refunded_lines, revenue_net, refunds_total, orders_hll, customers_hll
+        FROM public.sketch_daily
+        WHERE day BETWEEN :start AND :end
+    """), {"start": start, "end": end}).all()
+
+    lines = sum(r.order_lines for r in rows)
+    refunded = sum(r.refunded_lines for r in rows)
+    revenue = sum((r.revenue_net for r in rows), Decimal(0))
+    refunds = sum((r.refunds_total for r in rows), Decimal(0))
+    orders = hll.estimate(hll.merge(r.orders_hll for r in rows)) if rows else 0
+    customers = hll.estimate(hll.merge(r.customers_hll for r in rows)) if rows else 0
+
+    return {
+        "revenue_net": revenue,
+        "refunds_total": refunds,
+        "revenue_after_refunds": revenue - refunds,
+        "orders": orders,
+        "customers": customers,
+        "order_lines": lines,
+        "refund_rate_pct": _round(Decimal(100 * refunded) / lines, "0.01") if lines else None,
+        "aov": _round(revenue / orders, "0.01") if orders else None,
+    }
+
+
+def revenue_by_bucket(conn, start, end, bucket_sql: str) -> list:
+    rows = conn.execute(text(f"""
+        SELECT {bucket_sql} AS bucket, revenue_net, orders_hll, order_lines, refunded_lines
+        FROM public.sketch_daily sd
+        WHERE sd.day BETWEEN :start AND :end
+        ORDER BY sd.day
+    """), {"start": start, "end": end}).all()
+
+    out = []
+    for bucket, group in groupby(rows, key=lambda r: r.bucket):
+        group = list(group)
+        out.append({
+            "day": bucket,
+            "revenue_net": _round(sum((r.revenue_net for r in group), Decimal(0)), "0.01"),
+            "orders": hll.estimate(hll.merge(r.orders_hll for r in group)),
+            "order_lines": sum(r.order_lines for r in group),
+            "refunded_lines": sum(r.refunded_lines for r in group),
+        })
+    return out
+
+
+def revenue_by_category(conn, start, end) -> list:
+    rows = conn.execute(text("""
+        SELECT category, revenue_net, orders_hll
+        FROM public.sketch_daily_category
+        WHERE day BETWEEN :start AND :end
+        ORDER BY category
+    """), {"start": start, "end": end}).all()
+
+    out = []
+    for category, group in groupby(rows, key=lambda r: r.category):
+        group = list(group)
+        out.append({
+            "category": category,
+            "revenue_net": _round(sum((r.revenue_net for r in group), Decimal(0)), "0.01"),
+            "orders": hll.estimate(hll.merge(r.orders_hll for r in group)),
+        })
+    return sorted(out, key=lambda r: r["revenue_net"], reverse=True)
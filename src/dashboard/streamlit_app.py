@@ -11,6 +11,7 @@ st.caption(f"API_BASE = {API_BASE}")
 try:
     r = requests.get(f"{API_BASE}/health", timeout=20)
     st.success(f"Health OK: {r.status_code} {r.text}")
+    dataset_version = r.json().get("dataset_version")
 except Exception as e:
     st.error(f"Cannot reach API. Check API_BASE in Streamlit secrets. Error: {e}")
     st.stop()
@@ -23,6 +24,73 @@ def to_float(x, default=0.0):
         return default
 
 
+# A wide line chart can't show more points than this. Ranges with more days
+# are bucketed by the API (max_points) instead of drawn day by day.
+CHART_MAX_POINTS = 400
+
+
+def get_json(endpoint, params):
+    resp = requests.get(f"{API_BASE}{endpoint}", params=params, timeout=30)
+    if resp.status_code != 200:
+        st.error(f"{endpoint} failed: {resp.status_code}")
+        st.code(resp.text[:1000])
+        st.stop()
+    try:
+        return resp.json()
+    except Exception:
+        st.error(f"API returned non-JSON response for {endpoint}")
+        st.code(resp.text[:1000])
+        st.stop()
+
+
+def daily_series(endpoint, start, end, fields):
+    """One row per day in [start, end], fetching only days not cached yet.
+
+    Days live in session state per endpoint, so moving the range by a day
+    requests just that day. The cache is dropped when the API reports a new
+    dataset version (a pipeline run finished).
+    """
+    cache = st.session_state.setdefault("daily_cache", {})
+    if cache.get("_version") != dataset_version:
+        cache.clear()
+        cache["_version"] = dataset_version
+    days = cache.setdefault(endpoint, {})
+
+    wanted = [d.date() for d in pd.date_range(start, end)]
+
+    # Group missing days into contiguous runs: one request per run.
+    runs = []
+    for d in (d for d in wanted if d not in days):
+        if runs and (d - runs[-1][1]).days == 1:
+            runs[-1][1] = d
+        else:
+            runs.append([d, d])
+
+    for run_start, run_end in runs:
+        payload = get_json(endpoint, {"start": run_start.isoformat(), "end": run_end.isoformat()})
+        # Days without rows are real zeros; remember them so they aren't refetched.
+        for d in pd.date_range(run_start, run_end):
+            days[d.date()] = {f: 0.0 for f in fields}
+        for row in payload.get("data", []):
+            days[pd.to_datetime(row["day"]).date()] = {f: to_float(row.get(f)) for f in fields}
+
+    rows = [{"day": pd.Timestamp(d), **days[d]} for d in wanted]
+    return pd.DataFrame(rows, columns=["day", *fields])
+
+
+def series(endpoint, start, end, fields):
+    """Rows to chart and their granularity.
+
+    Ranges the chart can draw day by day come from the day cache; longer ones
+    are bucketed by the API, which returns at most CHART_MAX_POINTS rows.
+    """
+    if (end - start).days + 1 <= CHART_MAX_POINTS:
+        return daily_series(endpoint, start, end, fields), "day"
+    payload = get_json(endpoint, {"start": start.isoformat(), "end": end.isoformat(), "max_points": CHART_MAX_POINTS})
+    rows = [{"day": pd.to_datetime(r["day"]), **{f: to_float(r.get(f)) for f in fields}} for r in payload.get("data", [])]
+    return pd.DataFrame(rows, columns=["day", *fields]), payload.get("granularity", "day")
+
+
 st.set_page_config(page_title="Ecommerce Dashboard", layout="wide")
 st.title("📊 Ecommerce Dashboard")
 
@@ -35,31 +103,24 @@ with col2:
 
 params = {"start": start.isoformat(), "end": end.isoformat()}
 
-# --- KPIs ---
-resp = requests.get(f"{API_BASE}/kpis", params=params, timeout=30)
-
-if resp.status_code != 200:
-    st.error(f"/kpis failed: {resp.status_code}")
-    st.code(resp.text[:1000])
-    st.stop()
+df, granularity = series("/revenue/by-day", start, end, ["revenue_net", "orders", "order_lines", "refunded_lines"])
+roas_df, roas_granularity = series("/marketing/roas-by-day", start, end, ["revenue_net", "spend_eur"])
 
-try:
-    kpi_resp = resp.json()
-except Exception:
-    st.error("API returned non-JSON response for /kpis")
-    st.code(resp.text[:1000])
-    st.stop()
-
-k = kpi_resp.get("kpis", {})
-
-revenue_net = to_float(k.get("revenue_net"))
+# --- KPIs ---
+# Revenue and the line-based refund rate are additive, so they are summed from
+# the series above. Only distinct orders can't be added up across days; they
+# come from the HyperLogLog sketches (approx=true), not a full /kpis scan.
+k = get_json("/kpis", {**params, "approx": "true"}).get("kpis", {})
+
+revenue_net = float(df["revenue_net"].sum())
+order_lines = float(df["order_lines"].sum())
+refund_rate = 100.0 * float(df["refunded_lines"].sum()) / order_lines if order_lines else 0.0
 orders = int(to_float(k.get("orders")))
-aov = to_float(k.get("aov"))
-refund_rate = to_float(k.get("refund_rate_pct"))
+aov = revenue_net / orders if orders else 0.0
 
 kpi1, kpi2, kpi3, kpi4 = st.columns(4)
 kpi1.metric("Revenue (Net)", f"€{revenue_net:,.2f}")
-kpi2.metric("Orders", f"{orders:,}")
+kpi2.metric("Orders", f"~{orders:,}")
 kpi3.metric("AOV", f"€{aov:,.2f}")
 kpi4.metric("Refund Rate", f"{refund_rate:.2f}%")
 
@@ -67,15 +128,10 @@ kpi4.metric("Refund Rate", f"{refund_rate:.2f}%")
 st.divider()
 
 # --- Revenue by day chart ---
-rev_resp = requests.get(f"{API_BASE}/revenue/by-day", params=params).json()
-df = pd.DataFrame(rev_resp.get("data", []))
-
-if df.empty:
+if df.empty or not df["orders"].any():
     st.warning("No data returned for this date range.")
 else:
-    df["day"] = pd.to_datetime(df["day"])
-    df = df.sort_values("day")
-    st.subheader("Revenue by day")
+    st.subheader(f"Revenue by {granularity}")
     st.line_chart(df.set_index("day")["revenue_net"])
 
     with st.expander("Show data table"):
@@ -111,21 +167,16 @@ else:
 st.divider()
 st.subheader("Marketing performance (ROAS)")
 
-roas_resp = requests.get(f"{API_BASE}/marketing/roas-by-day", params=params).json()
-roas_df = pd.DataFrame(roas_resp.get("data", []))
-
-if roas_df.empty:
+if roas_df.empty or not roas_df[["revenue_net", "spend_eur"]].any().any():
     st.warning("No ROAS data returned.")
 else:
-    roas_df["day"] = pd.to_datetime(roas_df["day"])
-    roas_df["revenue_net"] = roas_df["revenue_net"].apply(to_float)
-    roas_df["spend_eur"] = roas_df["spend_eur"].apply(to_float)
-    roas_df["roas"] = roas_df["roas"].apply(to_float)
+    # ROAS is a ratio: recompute it from summed revenue and spend per bucket.
+    roas_df["roas"] = (roas_df["revenue_net"] / roas_df["spend_eur"].where(roas_df["spend_eur"] != 0)).fillna(0.0)
 
     # simple charts
     st.line_chart(roas_df.set_index("day")[["revenue_net", "spend_eur"]])
 
-    st.subheader("ROAS by day")
+    st.subheader(f"ROAS by {roas_granularity}")
     st.line_chart(roas_df.set_index("day")["roas"])
 
     with st.expander("Show ROAS table"):